@@ -0,0 +1,322 @@
+# benchmark.py
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import charts
+from correlation import correlation_matrix, daily_states
+from daily_summary import build_daily_summary, city_daily_summary, load_daily_summary, lookup_daily_summary
+from data_loader import (DATE_FORMAT, WEATHER_DTYPES, add_derived_columns, compact_weather_frame,
+                         expand_weather_frame, map_arrow_frame, read_weather_csv, write_arrow_frame)
+from derived_metrics import add_metric_columns
+from ingest import flatten_forecast, flatten_forecasts, iter_ndjson_batches
+from spatial_index import StationIndex, cluster_stations, viewport
+from time_index import TimeIndex, auto_rollup, rollup, sort_weather_frame
+from weather_store import WEATHER_COLUMNS, read_weather_store, write_weather_store
+
+# Row counts benchmarked by default: the shipped sample, a busy month, years of many cities
+DEFAULT_SIZES = [40, 100_000, 10_000_000]
+
+# Each synthetic city gets a 5 day / 3 hour forecast's worth of rows (40) or more history
+ROWS_PER_CITY = 40
+MAX_CITIES = 1000
+
+# The store holds one directory per city and day, so very large sizes are skipped by default
+STORE_MAX_ROWS = 1_000_000
+
+# Output file for the results, so runs can be compared
+RESULTS_PATH = 'bench_results.json'
+
+WEATHER_TYPES = [('Rain', 'light rain'), ('Rain', 'moderate rain'), ('Clouds', 'overcast clouds'),
+                 ('Clouds', 'broken clouds'), ('Clear', 'clear sky')]
+
+
+def synthetic_weather_data(rows, cities=None, seed=0, end=None):
+    # Forecast rows with the exact transformed_weather_data.csv schema: `cities` cities with
+    # 3-hourly forecasts, the last ones falling on `end` (today by default)
+    rng = np.random.default_rng(seed)
+    cities = cities or max(1, min(MAX_CITIES, rows // ROWS_PER_CITY))
+    city = np.arange(rows) % cities
+    step = np.arange(rows) // cities
+    steps = -(-rows // cities)
+
+    end = pd.Timestamp(end or datetime.today()).normalize() + pd.Timedelta(hours=21)
+    forecast_time = end - pd.to_timedelta((steps - 1 - step) * 3, unit='h')
+    hour = forecast_time.hour.to_numpy()
+
+    # Daily temperature cycle around a per-city base temperature
+    base = rng.uniform(10, 32, cities)[city]
+    temperature = base + 4 * np.sin((hour - 9) / 24 * 2 * np.pi) + rng.normal(0, 1, rows)
+    humidity = np.clip(95 - 2 * (temperature - base) + rng.normal(0, 5, rows), 20, 100)
+    weather = rng.integers(0, len(WEATHER_TYPES), rows)
+    weather_main = np.array([main for main, _ in WEATHER_TYPES], dtype=object)
+    weather_description = np.array([description for _, description in WEATHER_TYPES], dtype=object)
+
+    latitude = rng.uniform(-60, 70, cities)
+    longitude = rng.uniform(-180, 180, cities)
+    names = np.array([f'City {i}' for i in range(cities)], dtype=object)
+    timezones = np.array([f'UTC{offset:+d}' for offset in np.round(longitude / 15).astype(int)], dtype=object)
+    day = forecast_time.normalize()
+
+    df = pd.DataFrame({
+        'forecast_time': forecast_time,
+        'temperature': temperature.round(2),
+        'feels_like_temperature': (temperature + (humidity - 50) / 20).round(2),
+        'min_temperature': (temperature - rng.uniform(0, 2, rows)).round(2),
+        'max_temperature': (temperature + rng.uniform(0, 2, rows)).round(2),
+        'pressure': rng.normal(1012, 4, rows).round(0),
+        'humidity': humidity.round(0),
+        'cloudiness': rng.uniform(0, 100, rows).round(0),
+        'wind_speed': rng.gamma(2, 1.2, rows).round(2),
+        'wind_direction': rng.uniform(0, 360, rows).round(0),
+        'visibility': np.where(rng.random(rows) < 0.9, 10000.0, rng.uniform(2000, 10000, rows).round(0)),
+        'precipitation_probability': rng.random(rows).round(2),
+        'rain_volume': np.where(weather < 2, rng.gamma(1, 1.5, rows), 0).round(2),
+        'weather_main': weather_main[weather],
+        'weather_description': weather_description[weather],
+        'city_name': names[city],
+        'country': 'Nigeria',
+        'city_latitude': latitude[city].round(2),
+        'city_longitude': longitude[city].round(2),
+        'population': rng.integers(10_000, 5_000_000, cities)[city],
+        'timezone': timezones[city],
+        'sunrise': day + pd.Timedelta(hours=6, minutes=30),
+        'sunset': day + pd.Timedelta(hours=18, minutes=45),
+    })
+    return df[WEATHER_COLUMNS].astype(WEATHER_DTYPES)
+
+
+def synthetic_responses(count, seed=0):
+    # Raw OpenWeatherMap /forecast payloads (40 three-hourly entries each) for the flatten stage
+    rng = np.random.default_rng(seed)
+    start = int(pd.Timestamp.now(tz='UTC').floor('D').timestamp())
+    responses = []
+    for i in range(count):
+        responses.append({
+            'list': [{
+                'dt': start + 3 * 3600 * j,
+                'main': {'temp': float(rng.uniform(20, 30)), 'feels_like': float(rng.uniform(20, 33)),
+                         'temp_min': 20.0, 'temp_max': 30.0, 'pressure': 1012, 'humidity': int(rng.integers(40, 100))},
+                'weather': [{'id': 500, 'main': 'Rain', 'description': 'light rain', 'icon': '10d'}],
+                'clouds': {'all': int(rng.integers(0, 100))},
+                'wind': {'speed': float(rng.uniform(0, 5)), 'deg': int(rng.integers(0, 360)), 'gust': 3.1},
+                'visibility': 10000,
+                'pop': float(rng.random()),
+                'rain': {'3h': 0.5} if j % 2 else {},
+                'sys': {'pod': 'd'},
+                'dt_txt': '',
+            } for j in range(40)],
+            'city': {'id': i, 'name': f'City {i}', 'coord': {'lat': 7.42, 'lon': 3.93}, 'country': 'NG',
+                     'population': 3565108, 'timezone': 3600, 'sunrise': start + 20000, 'sunset': start + 64000},
+        })
+    return responses
+
+
+def best_time(func, repeat):
+    # Best wall-clock time of `repeat` runs (the least disturbed by other load), and the last result
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def tile_aggregates(df_today):
+    # The "Weather Overview" tile values as the dashboard used to compute them on every rerun
+    return (
+        df_today['temperature'].max(),
+        df_today['temperature'].min(),
+        df_today['precipitation_probability'].sum(),
+        df_today['wind_speed'].max(),
+        pd.to_datetime(df_today['sunrise'].values[0]).strftime('%I:%M %p'),
+        pd.to_datetime(df_today['sunset'].values[0]).strftime('%I:%M %p'),
+    )
+
+
+def figure_builders(df, states, days, stations, city, start, end):
+    # One builder per dashboard chart, fed the way weather_app.py feeds them: df is one city's
+    # selected rows (see selected_rows), days its daily summary rows and the heatmap is
+    # limited to the same city and range
+    return {
+        'temperature_trend': lambda: charts.temperature_trend_figure(df),
+        'location_map': lambda: charts.stations_map_figure(
+            cluster_stations(stations, 3, 'Temperature (°C)'), 7.3775, 3.9470, 3, 'Ibadan', 'Temperature (°C)', 'token'),
+        'humidity_temperature': lambda: charts.humidity_temperature_figure(df),
+        'temperature_feels_like': lambda: charts.temperature_feels_like_figure(df),
+        'precipitation_probability': lambda: charts.precipitation_probability_figure(df),
+        'wind_pressure': lambda: charts.wind_pressure_figure(df),
+        'temperature_range': lambda: charts.temperature_range_figure(df),
+        'humidity_area': lambda: charts.humidity_area_figure(df),
+        'comfort': lambda: charts.comfort_figure(df),
+        'daily_rollups': lambda: charts.daily_rollups_figure(days),
+        'correlation_heatmap': lambda: charts.correlation_heatmap_figure(
+            correlation_matrix(states, city=city, start=start, end=end)),
+    }
+
+
+def run_size(rows, repeat, workdir, store_max_rows=STORE_MAX_ROWS):
+    # Time every stage for one data size; returns a list of result records
+    results = []
+    today = datetime.today().date()
+
+    def record(stage, seconds, **extra):
+        results.append({'rows': rows, 'stage': stage, 'seconds': seconds, **extra})
+        print(f'{rows:>10,} rows  {stage:<40} {seconds * 1000:10.2f} ms')
+
+    seconds, df = best_time(lambda: synthetic_weather_data(rows), 1)
+    record('generate', seconds, cities=int(df['city_name'].nunique()))
+
+    # Load: CSV text parsing vs. the columnar store
+    csv_path = os.path.join(workdir, f'weather_{rows}.csv')
+    df.to_csv(csv_path, index=False, date_format=DATE_FORMAT)
+    record('load_csv', best_time(lambda: read_weather_csv(csv_path), repeat)[0],
+           bytes=os.path.getsize(csv_path))
+
+    # In-memory footprint of the cached frame, before and after compaction
+    seconds, compact = best_time(lambda: compact_weather_frame(df), 1)
+    record('compact_frame', seconds, bytes_before=int(df.memory_usage(deep=True).sum()),
+           bytes_after=int(compact.memory_usage(deep=True).sum()))
+
+    # Load through the shared memory-mapped Arrow frame the dashboard uses
+    arrow_path = os.path.join(workdir, f'weather_{rows}.arrow')
+    write_arrow_frame(add_derived_columns(compact), arrow_path)
+    record('load_mapped', best_time(lambda: map_arrow_frame(arrow_path), repeat)[0])
+
+    store_path = os.path.join(workdir, f'store_{rows}')
+    if rows <= store_max_rows:
+        record('write_store', best_time(lambda: write_weather_store(df, store_path), 1)[0])
+        record('load_store', best_time(lambda: read_weather_store(store_path), repeat)[0])
+    else:
+        results.append({'rows': rows, 'stage': 'load_store', 'skipped': f'more than {store_max_rows} rows'})
+
+    # Today's rows: full-frame mask vs. partition pruning
+    seconds, df_today = best_time(lambda: df[df['forecast_time'].dt.date == today], repeat)
+    record('today_filter_mask', seconds)
+    if rows <= store_max_rows:
+        tile_columns = ['forecast_time', 'temperature', 'precipitation_probability', 'wind_speed', 'sunrise', 'sunset']
+        record('today_filter_partition', best_time(
+            lambda: read_weather_store(store_path, date=today, columns=tile_columns), repeat)[0])
+
+    # One city's last week: full-frame mask vs. binary search on the (city, time) sorted frame
+    city = df['city_name'].iloc[-1]
+    week_end = df['forecast_time'].max()
+    week_start = week_end - pd.Timedelta(days=7)
+    record('range_query_mask', best_time(
+        lambda: df[(df['city_name'] == city) & df['forecast_time'].between(week_start, week_end)], repeat)[0])
+    seconds, index = best_time(lambda: TimeIndex(sort_weather_frame(df)), 1)
+    record('range_index_build', seconds)
+    record('range_query_index', best_time(lambda: index.range(city, week_start, week_end), repeat)[0])
+
+    # Stations map: viewport query on the station grid vs. a scan, clustering, nearest station
+    seconds, station_index = best_time(lambda: StationIndex(index), 1)
+    record('station_index_build', seconds, stations=len(station_index.stations))
+    seconds, current = best_time(lambda: station_index.current(week_end), 1)
+    record('station_current', seconds)
+    center = current.iloc[0]
+    bounds = viewport(center['lat'], center['lon'], 3)
+    record('viewport_query_scan', best_time(
+        lambda: current[current['lat'].between(bounds[0], bounds[1]) & current['lon'].between(bounds[2], bounds[3])],
+        repeat)[0])
+    seconds, visible = best_time(lambda: current.iloc[station_index.in_viewport(*bounds)], repeat)
+    record('viewport_query_grid', seconds, visible=len(visible))
+    seconds, markers = best_time(lambda: cluster_stations(visible, 3, 'Temperature (°C)'), repeat)
+    record('viewport_cluster', seconds, markers=len(markers))
+    record('nearest_station', best_time(lambda: station_index.nearest(center['lat'] + 0.5, center['lon']), repeat)[0])
+
+    # Metric tiles: aggregating today's rows vs. the precomputed daily summary
+    record('tiles_aggregate', best_time(lambda: tile_aggregates(df_today), repeat)[0])
+    seconds, summary = best_time(lambda: build_daily_summary(df), 1)
+    record('tiles_build_summary', seconds)
+    summary = summary.set_index(['city_name', 'forecast_date']).sort_index()
+    if rows <= store_max_rows:
+        _, summary = load_daily_summary(store_path)
+    record('tiles_summary_lookup', best_time(lambda: lookup_daily_summary(summary, city, today), repeat)[0])
+
+    # Figures, including the correlation engine behind the heatmap
+    seconds, states = best_time(lambda: daily_states(df), 1)
+    record('correlation_states', seconds)
+    record('correlation_matrix', best_time(lambda: correlation_matrix(states), repeat)[0])
+    record('correlation_full_scan', best_time(
+        lambda: df[['temperature', 'feels_like_temperature', 'humidity', 'cloudiness',
+                    'precipitation_probability', 'wind_speed', 'pressure']].corr(), repeat)[0])
+
+    # Dew point and heat index columns, computed over the whole frame as at load time
+    seconds, df = best_time(lambda: add_metric_columns(df), repeat)
+    record('metric_columns', seconds)
+
+    # The dashboard builds its figures from the selected city's date range (its whole forecast
+    # by default), rolled up automatically when the range is too wide to plot raw
+    seconds, frame = best_time(lambda: add_derived_columns(compact_weather_frame(sort_weather_frame(df))), 1)
+    record('dashboard_frame', seconds)
+    frame_index = TimeIndex(frame)
+    first_time, last_time = frame_index.time_bounds(city)
+    start, end = first_time.normalize(), last_time.normalize() + pd.Timedelta(days=1) - pd.Timedelta(1)
+    city_rows = frame_index.range(city, start, end)
+    label = auto_rollup(len(city_rows), start, end)
+    seconds, selected = best_time(lambda: rollup(expand_weather_frame(city_rows), label), repeat)
+    record('selected_rows', seconds, city_rows=len(city_rows), rollup=label, selected=len(selected))
+
+    days = city_daily_summary(summary, city, start, end)
+    for name, build in figure_builders(selected, states, days, visible, city, start, end).items():
+        seconds, fig = best_time(build, repeat)
+        serialize_seconds, payload = best_time(fig.to_json, 1)
+        record(f'figure_{name}', seconds, serialize_seconds=serialize_seconds, payload_bytes=len(payload))
+
+    # The notebook's flatten/transform, on the pure-Python ingest engine
+    responses = synthetic_responses(max(1, rows // ROWS_PER_CITY) if rows <= store_max_rows else MAX_CITIES)
+    seconds, _ = best_time(lambda: [flatten_forecast(response) for response in responses], 1)
+    record('flatten_transform', seconds, responses=len(responses))
+    seconds, _ = best_time(lambda: flatten_forecasts(responses), repeat)
+    record('flatten_batch', seconds, responses=len(responses))
+
+    # The same responses streamed from a newline-delimited archive
+    with tempfile.TemporaryDirectory() as folder:
+        archive = os.path.join(folder, 'responses.ndjson')
+        with open(archive, 'w') as f:
+            for response in responses:
+                f.write(json.dumps(response) + '\n')
+        seconds, _ = best_time(lambda: list(iter_ndjson_batches(archive)), repeat)
+        record('flatten_ndjson', seconds, responses=len(responses))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the weather data pipeline and dashboard stages.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma-separated row counts (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, best time kept')
+    parser.add_argument('--store-max-rows', type=int, default=STORE_MAX_ROWS,
+                        help='skip the Parquet store stages above this many rows')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON results file')
+    args = parser.parse_args()
+
+    results = []
+    started_at = datetime.now().isoformat(timespec='seconds')
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in (int(size) for size in args.sizes.split(',')):
+            results.extend(run_size(rows, args.repeat, workdir, args.store_max_rows))
+
+    report = {
+        'started_at': started_at,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    print(f'Wrote {len(results)} results to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
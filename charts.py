@@ -0,0 +1,534 @@
+# charts.py
+import numpy as np
+import plotly.graph_objects as go
+
+from downsample import CHART_WIDTH_PX, lttb_indices, minmax_indices
+
+# Figure builders for the dashboard sections. Each takes the loaded weather data and
+# returns a finished Plotly figure; weather_app.py caches them per data version.
+
+
+def temperature_trend_figure(df, max_points=CHART_WIDTH_PX):
+    # plotly.express is imported on first use, so a cold start doesn't pay for it
+    import plotly.express as px
+
+    # Long histories are reduced to about one point per pixel, keeping the line's shape (LTTB)
+    df = df.iloc[lttb_indices(df['forecast_time'], df['temperature'], max_points)]
+
+    # Create an interactive Plotly line chart for temperature trends
+    fig = px.line(df, x='forecast_time', y='temperature', 
+                title='Temperature Forecasts',
+                labels={'forecast_time': 'Time', 'temperature': 'Temperature (°C)'}, 
+                template='plotly_white')
+
+    # Customize the layout for weather theme
+    fig.update_traces(line_color='#ff7f0e', line_width=3, mode='lines+markers',
+                    marker=dict(size=6, color='#ff7f0e', symbol='circle'))
+
+    # Customize title and axis properties
+    fig.update_layout(
+        title=dict(
+            text="Temperature Forecasts",  
+            x=0.5,  # Center the title
+            xanchor='center',  # Align it in the center
+            yanchor='top',  # Optional: Align vertically at the top
+            font=dict(size=20, color='#1f77b4', family="Arial Black")
+        ),
+        xaxis_title_font=dict(size=14, color='#4c4c4c'),
+        yaxis_title_font=dict(size=14, color='#4c4c4c'),
+        xaxis=dict(showgrid=True, gridcolor='lightgrey'),
+        yaxis=dict(showgrid=True, gridcolor='lightgrey'),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        paper_bgcolor='rgba(0,0,0,0)'  # Overall transparent background
+    )
+
+    return fig
+
+
+def stations_map_figure(markers, lat, lon, zoom, label, metric, api_key):
+    # Station (or cluster) markers in the viewport, colored by the chosen metric; clusters are
+    # drawn bigger the more stations they hold. customdata carries each marker's coordinates
+    # so a click can select the nearest station.
+    fig = go.Figure(go.Scattermapbox(
+        lat=markers['lat'],
+        lon=markers['lon'],
+        mode='markers',
+        marker=go.scattermapbox.Marker(
+            size=10 + 4 * np.log2(markers['count'].to_numpy(dtype='float64')) if len(markers) else 10,
+            color=markers['value'],
+            colorscale='RdYlBu_r',
+            showscale=True,
+            colorbar=dict(title=metric, thickness=12),
+        ),
+        text=markers['city_name'],
+        customdata=markers[['lat', 'lon']].to_numpy(),
+        hovertemplate='%{text}<br>' + metric + ': %{marker.color:.1f}<extra></extra>',
+        name='Stations',
+    ))
+
+    # The selected city
+    fig.add_trace(go.Scattermapbox(
+        lat=[lat],
+        lon=[lon],
+        mode='markers',
+        marker=go.scattermapbox.Marker(size=14, color='blue'),
+        text=[label],
+        customdata=[[lat, lon]],
+        hoverinfo='text',
+        name=label,
+    ))
+
+    # Set the mapbox style and initial zoom
+    fig.update_layout(
+        mapbox=dict(
+            style="streets",  # Change this to Mapbox-specific style like 'streets', 'satellite'
+            center=dict(lat=lat, lon=lon),
+            zoom=zoom,
+            accesstoken=api_key  # Use the Mapbox token here
+        ),
+        height=400,
+        margin={"r":0,"t":0,"l":0,"b":0},
+        showlegend=False
+    )
+
+    return fig
+
+
+def humidity_temperature_figure(df):
+    import plotly.express as px
+
+    # Create an interactive Plotly scatter plot for Humidity vs. Temperature
+    fig = px.scatter(df, x='temperature', y='humidity', 
+                    title='Humidity vs. Temperature Forecasts',
+                    labels={'temperature': 'Temperature (°C)', 'humidity': 'Humidity (%)'},
+                    template='plotly_white')
+
+    # Customize scatter points and transparency
+    fig.update_traces(marker=dict(size=12, color='#1f77b4', opacity=0.9))
+
+    # Customize title and axis properties
+    fig.update_layout(
+        title=dict(
+            text="Humidity vs. Temperature Forecasts",  # Your plot title
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title based on the center
+            yanchor='top',  # Keep the title at the top vertically
+            font=dict(size=20, color='#2ca02c', family="Arial Black")  # Fresh green title
+        ),
+        xaxis_title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis label
+        yaxis_title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for y-axis label
+        xaxis=dict(showgrid=True, gridcolor='lightgrey', gridwidth=0.5),
+        yaxis=dict(showgrid=True, gridcolor='lightgrey', gridwidth=0.5),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
+    )
+
+    return fig
+
+
+def temperature_feels_like_figure(df):
+    # Step 1: Create a bar chart using Plotly
+    x = df['date']
+
+    # Initialize the figure
+    fig2 = go.Figure()
+
+    # Add Temperature bars (warm orange color)
+    fig2.add_trace(go.Bar(
+        x=x, 
+        y=df['temperature'], 
+        name='Temperature', 
+        marker_color='#ff7f0e',
+        hoverinfo='y'
+    ))
+
+    # Add Feels Like bars (harsher red color)
+    fig2.add_trace(go.Bar(
+        x=x, 
+        y=df['feels_like_temperature'], 
+        name='Feels Like', 
+        marker_color='#e63946',
+        hoverinfo='y'
+    ))
+
+    # Update layout for interactivity, theming, and readability
+    fig2.update_layout(
+        barmode='group',  # Group the bars side by side
+        title=dict(
+            text='Temperature and Feels Like Forecasts',  # Title text
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title based on the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green for title
+        ),
+        xaxis=dict(
+            title='Date', 
+            title_font=dict(size=14, color='#ff7f0e'),  # Orange for x-axis label
+            tickformat='%d %b'  # Date format
+        ),
+        yaxis=dict(
+            title='Temperature (°C)', 
+            title_font=dict(size=14, color='#ff7f0e'),  # Orange for y-axis label
+            showgrid=True, 
+            gridcolor='lightgrey', 
+            gridwidth=0.5  # Light grey grid
+        ),
+        legend=dict(x=0.9, y=1.15, orientation="h"),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
+    )
+
+    # Add tooltips and hover features
+    fig2.update_traces(hovertemplate='%{y:.2f}°C')
+
+    return fig2
+
+
+def precipitation_probability_figure(df):
+    # Precipitation probability bars
+    fig_precipitation = go.Figure()
+
+    # Plot Precipitation Probability
+    fig_precipitation.add_trace(go.Bar(
+        x=df['date'],
+        y=df['precipitation_probability'] * 100,
+        name='Precipitation Probability Forcasts',
+        marker_color='#1f77b4'  # Deep blue
+    ))
+
+    # Update layout for the Precipitation Probability plot
+    fig_precipitation.update_layout(
+        title=dict(
+            text='Precipitation Probability Forecasts',
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title at the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#1f77b4', family="Arial Black")  # Blue for title
+        ),
+        xaxis=dict(
+            title='Date', 
+            title_font=dict(size=14, color='#2ca02c'),  # Green for x-axis label
+            tickformat='%d %b'  # Format for the date
+        ),
+        yaxis=dict(
+            title='Precipitation Probability (%)',
+            title_font=dict(size=14, color='#2ca02c'),  # Green for y-axis label
+            gridcolor='lightgrey', 
+            gridwidth=0.5  # Light grey grid
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
+        showlegend=False  # Hides the legend
+    )
+
+    return fig_precipitation
+
+
+def wind_pressure_figure(df):
+    # Wind speed bars with a pressure line
+    fig_wind_pressure = go.Figure()
+
+    # Add Wind Speed bars
+    fig_wind_pressure.add_trace(go.Bar(
+        x=df['date'],
+        y=df['wind_speed'],
+        name='Wind Speed',
+        marker_color='#bcbd22'  # Earthy brown
+    ))
+
+    # Add Pressure line
+    fig_wind_pressure.add_trace(go.Scatter(
+        x=df['date'],
+        y=df['pressure'],
+        mode='lines',
+        name='Pressure',
+        line=dict(color='#1f77b4', width=2)  
+    ))
+
+    # Update layout for the Wind Speed and Pressure plot
+    fig_wind_pressure.update_layout(
+        title=dict(
+            text='Wind Speed and Pressure Forecasts',
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title at the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#1f77b4', family="Arial Black")  # Blue for title
+        ),
+        xaxis=dict(
+            title='Date', 
+            title_font=dict(size=14, color='#2ca02c'),  # Green for x-axis label
+            tickformat='%d %b'
+        ),
+        yaxis=dict(
+            title='Wind Speed (m/s)',
+            title_font=dict(size=14, color='#2ca02c'),  # Green for y-axis label
+            gridcolor='lightgrey', 
+            gridwidth=0.4
+        ),
+        yaxis2=dict(
+            title='Pressure (hPa)', 
+            overlaying='y', 
+            side='right', 
+            showgrid=False, 
+            tickfont=dict(color='#7f7f7f')  # Grey for the secondary axis
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
+        showlegend=True  # Display the legend
+    )
+
+    return fig_wind_pressure
+
+
+def temperature_range_figure(df, max_points=CHART_WIDTH_PX):
+    # Long histories are reduced to a min/max envelope per pixel bucket, keeping the peaks
+    df = df.iloc[minmax_indices(df['max_temperature'], df['min_temperature'], max_points=max_points)]
+
+    # Create an area chart for temperature range
+    fig_temp_range = go.Figure()
+
+    # Max temperature (area fill)
+    fig_temp_range.add_trace(go.Scatter(
+        x=df['date'],
+        y=df['max_temperature'],
+        name='Max Temp',
+        fill='tonexty',
+        mode='none',  # No line, just filled area
+        fillcolor='rgba(255, 69, 0, 0.6)',  # Red-orange fill
+    ))
+
+    # Min temperature (area fill)
+    fig_temp_range.add_trace(go.Scatter(
+        x=df['date'],
+        y=df['min_temperature'],
+        name='Min Temp',
+        fill='tozeroy',
+        mode='none',
+        fillcolor='rgba(30, 144, 255, 0.6)',  # Cool blue fill
+    ))
+
+    # Update layout for temperature plot
+    fig_temp_range.update_layout(
+        title=dict(
+            text='Today & 5-Day Temperature Forecast',
+            x=0.5,  # Center the title
+            xanchor='center',  # Align title center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green title
+        ),
+        xaxis=dict(
+            title='Date',
+            title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis
+            tickformat='%d %b'  # Format date as "23 Aug"
+        ),
+        yaxis=dict(
+            title='Temperature (°C)',
+            title_font=dict(size=14, color='#ff7f0e')  # Warm orange for y-axis
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        showlegend=True,  # Show legend
+        legend=dict(
+            orientation="h", 
+            yanchor="bottom", 
+            y=1.02, 
+            xanchor="right", 
+            x=1
+        )  # Horizontal legend at the top
+    )
+
+    return fig_temp_range
+
+
+def humidity_area_figure(df, max_points=CHART_WIDTH_PX):
+    # Long histories are reduced to a min/max envelope per pixel bucket, keeping the peaks
+    df = df.iloc[minmax_indices(df['humidity'], max_points=max_points)]
+
+    # Create an area chart for humidity
+    fig_humidity = go.Figure()
+
+    # Plot Humidity with fill
+    fig_humidity.add_trace(go.Scatter(
+        x=df['date'],
+        y=df['humidity'],
+        name='Humidity',
+        fill='tozeroy',
+        mode='none',
+        fillcolor='rgba(225, 69, 0, 0.6)',  
+    ))
+
+    # Update layout for humidity plot
+    fig_humidity.update_layout(
+        title=dict(
+            text='Today & A 5-Day Humidity Forecast',
+            x=0.5,  # Center the title
+            xanchor='center',  # Align title center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green title
+        ),
+        xaxis=dict(
+            title='Date',
+            title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis title
+            tickformat='%d %b'  # Format date as "23 Aug"
+        ),
+        yaxis=dict(
+            title='Humidity (%)',
+            title_font=dict(size=14, color='#ff7f0e')  # Warm orange for y-axis title
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
+        showlegend=True,  # Enable the legend
+        legend=dict(
+            orientation="h", 
+            yanchor="bottom", 
+            y=1.02, 
+            xanchor="right", 
+            x=1
+        )  # Horizontal legend at the top
+    )
+
+    return fig_humidity
+
+
+def correlation_heatmap_figure(corr_matrix):
+    # Step 1: The correlation matrix comes precomputed from the correlation engine (correlation.py)
+
+    # Step 2: Convert correlation matrix to a 2D array for plotting
+    z = corr_matrix.values
+    x_labels = corr_matrix.columns.tolist()
+    y_labels = corr_matrix.columns.tolist()
+
+    # Step 3: Create the heatmap using Plotly (figure_factory is slow to import, so only
+    # when the heatmap is actually drawn)
+    import plotly.figure_factory as ff
+    fig_heatmap = ff.create_annotated_heatmap(
+        z, 
+        x=x_labels, 
+        y=y_labels, 
+        colorscale='RdBu',  # Red-Blue color scheme for weather
+        reversescale=True,  # To match the coolwarm theme
+        annotation_text=np.round(z, decimals=2),  # Display correlation values
+        showscale=True  # Color bar scale
+    )
+
+    # Step 4: Update the layout for the heatmap
+    fig_heatmap.update_layout(
+        title=dict(
+            text='Correlation Heatmap of Weather Variables',
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Anchor the title to the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#FF8C00', family="Arial Black")  # Warm orange for the title
+        ),
+        xaxis_nticks=len(x_labels),  # Ensure we have labels for all columns
+        yaxis_nticks=len(y_labels),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
+    )
+
+    return fig_heatmap
+
+
+def comfort_figure(df, max_points=CHART_WIDTH_PX):
+    # Long histories are reduced to about one point per pixel, keeping the line's shape (LTTB)
+    df = df.iloc[lttb_indices(df['forecast_time'], df['temperature'], max_points)]
+
+    # Temperature with the dew point and heat index derived from it at load time
+    fig_comfort = go.Figure()
+    for column, name, color in [('heat_index', 'Heat Index', '#e63946'),
+                                ('temperature', 'Temperature', '#ff7f0e'),
+                                ('dew_point', 'Dew Point', '#1f77b4')]:
+        fig_comfort.add_trace(go.Scatter(
+            x=df['forecast_time'],
+            y=df[column],
+            mode='lines',
+            name=name,
+            line=dict(color=color, width=2),
+        ))
+
+    # Update layout for the comfort plot
+    fig_comfort.update_layout(
+        title=dict(
+            text='Heat Index and Dew Point Forecasts',
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title at the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green title
+        ),
+        xaxis=dict(
+            title='Time',
+            title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis label
+            showgrid=True,
+            gridcolor='lightgrey'
+        ),
+        yaxis=dict(
+            title='Temperature (°C)',
+            title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for y-axis label
+            showgrid=True,
+            gridcolor='lightgrey'
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+
+    # Add tooltips and hover features
+    fig_comfort.update_traces(hovertemplate='%{y:.2f}°C')
+
+    return fig_comfort
+
+
+def daily_rollups_figure(days):
+    # Diurnal range and rain total bars per forecast day, from the daily summary rows
+    # (computed at ingest); the dominant wind direction is written on the range bars
+    x = days['forecast_date']
+
+    fig_daily = go.Figure()
+
+    # Diurnal temperature range bars, labelled with the dominant wind direction
+    fig_daily.add_trace(go.Bar(
+        x=x,
+        y=days['diurnal_range'],
+        name='Diurnal Range (°C)',
+        marker_color='#ff7f0e',
+        text=days['dominant_wind_compass'].fillna('calm'),
+        textposition='outside',
+        hovertemplate='%{y:.2f}°C, wind from %{text}',
+    ))
+
+    # Daily rain total bars
+    fig_daily.add_trace(go.Bar(
+        x=x,
+        y=days['total_rain'],
+        name='Rain Total (mm)',
+        marker_color='#1f77b4',
+        hovertemplate='%{y:.2f} mm',
+    ))
+
+    # Update layout for the daily rollups plot
+    fig_daily.update_layout(
+        barmode='group',  # Group the bars side by side
+        title=dict(
+            text='Daily Range, Rain and Dominant Wind',
+            x=0.5,  # Center the title horizontally
+            xanchor='center',  # Align the title at the center
+            yanchor='top',  # Keep the title at the top
+            font=dict(size=20, color='#1f77b4', family="Arial Black")  # Blue for title
+        ),
+        xaxis=dict(
+            title='Date',
+            title_font=dict(size=14, color='#2ca02c'),  # Green for x-axis label
+            tickformat='%d %b'
+        ),
+        yaxis=dict(
+            title='°C / mm',
+            title_font=dict(size=14, color='#2ca02c'),  # Green for y-axis label
+            gridcolor='lightgrey',
+            gridwidth=0.5
+        ),
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+
+    return fig_daily
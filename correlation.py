@@ -0,0 +1,153 @@
+# correlation.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loader import load_cached, read_weather_csv
+from date_tables import read_dates, replace_dates, upsert_dates
+
+# Weather variables of the correlation heatmap
+CORRELATION_COLUMNS = [
+    'temperature', 'feels_like_temperature', 'humidity', 'cloudiness',
+    'precipitation_probability', 'wind_speed', 'pressure',
+]
+
+# Per-city, per-day moment states live inside the store next to the daily summary, one
+# folder per forecast date (see date_tables.py)
+STATES_FOLDER = '_correlation_states'
+
+# Single-file states written by earlier versions, replaced by a rebuild
+LEGACY_STATES_FILE = '_correlation_states.parquet'
+
+
+def states_path(root):
+    return os.path.join(root, STATES_FOLDER)
+
+
+def daily_states(df):
+    # Count, mean vector and co-moment matrix (sum of products of deviations from the mean)
+    # of the weather variables, for each city and forecast date. Rows with a missing value
+    # in any of the variables are left out.
+    df = df.dropna(subset=CORRELATION_COLUMNS)
+    keys = [df['city_name'], df['forecast_time'].dt.strftime('%Y-%m-%d').rename('forecast_date')]
+    grouped = df[CORRELATION_COLUMNS].groupby(keys, sort=True)
+
+    means = grouped.mean()
+    deviations = df[CORRELATION_COLUMNS] - grouped.transform('mean')
+
+    # Co-moments from the deviations (two-pass within each day, so no cancellation error)
+    k = len(CORRELATION_COLUMNS)
+    products = {
+        f'{i}_{j}': deviations.iloc[:, i] * deviations.iloc[:, j]
+        for i in range(k) for j in range(i, k)
+    }
+    sums = pd.DataFrame(products).groupby(keys, sort=True).sum()
+
+    comoments = np.empty((len(sums), k, k))
+    for i in range(k):
+        for j in range(i, k):
+            comoments[:, i, j] = comoments[:, j, i] = sums[f'{i}_{j}'].to_numpy()
+
+    return pd.DataFrame({
+        'city_name': means.index.get_level_values(0),
+        'forecast_date': means.index.get_level_values(1),
+        'n': grouped.size().to_numpy(),
+        'mean': list(means.to_numpy()),
+        'comoment': list(comoments.reshape(len(sums), k * k)),
+    })
+
+
+def merge_states(states):
+    # Combine any number of states into one (the parallel form of Welford's update):
+    #   mean = sum(n_i * mean_i) / N
+    #   C    = sum(C_i) + sum(n_i * (mean_i - mean)(mean_i - mean)^T)
+    k = len(CORRELATION_COLUMNS)
+    if len(states) == 0:
+        return 0, np.full(k, np.nan), np.zeros((k, k))
+
+    counts = states['n'].to_numpy(dtype='float64')
+    means = np.stack(states['mean'].to_numpy())
+    comoments = np.stack(states['comoment'].to_numpy()).reshape(-1, k, k)
+
+    total = counts.sum()
+    mean = counts @ means / total
+    spread = means - mean
+    comoment = comoments.sum(axis=0) + np.einsum('n,ni,nj->ij', counts, spread, spread)
+    return int(total), mean, comoment
+
+
+def correlation_matrix(states, city=None, start=None, end=None, last_days=None):
+    # Pearson correlation of the weather variables from the stored states, optionally for
+    # one city and a window of forecast dates (start/end inclusive, or the last N days)
+    if city is not None:
+        states = states[states['city_name'] == city]
+    if last_days is not None and len(states):
+        end = pd.Timestamp(states['forecast_date'].max())
+        start = end - pd.Timedelta(days=last_days - 1)
+    if start is not None:
+        states = states[states['forecast_date'] >= pd.Timestamp(start).strftime('%Y-%m-%d')]
+    if end is not None:
+        states = states[states['forecast_date'] <= pd.Timestamp(end).strftime('%Y-%m-%d')]
+
+    n, _, comoment = merge_states(states)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(np.diag(comoment))
+        corr = comoment / np.outer(std, std)
+    if n < 2:
+        corr[:] = np.nan
+    return pd.DataFrame(corr, index=CORRELATION_COLUMNS, columns=CORRELATION_COLUMNS)
+
+
+def update_correlation_states(root, latest):
+    # Recompute the states of the city/date pairs in latest (the latest stored version of
+    # every partition a write touched) and upsert them into the stored states.
+    # Only the folders of the touched dates are rewritten.
+    if not os.path.isdir(states_path(root)):
+        # No states yet, or ones written in the earlier single-file layout: build them once from the store
+        rebuild_correlation_states(root)
+        return
+    fresh = daily_states(latest)
+    touched = pd.DataFrame({
+        'city_name': latest['city_name'],
+        'forecast_date': latest['forecast_time'].dt.strftime('%Y-%m-%d'),
+    }).drop_duplicates()
+    upsert_dates(states_path(root), fresh, touched)
+
+
+def rebuild_correlation_states(root, df=None):
+    # Recompute every state from the store (df: the whole store, when already read)
+    if df is None:
+        from weather_store import read_weather_store
+        df = read_weather_store(root)
+    replace_dates(states_path(root), daily_states(df))
+    legacy_path = os.path.join(root, LEGACY_STATES_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def _read_states(root):
+    states = read_dates(states_path(root))
+    if states is None:
+        states = pd.DataFrame({column: [] for column in ['city_name', 'forecast_date', 'n', 'mean', 'comoment']})
+    return states
+
+
+def _states_from_csv(path):
+    return daily_states(read_weather_csv(path))
+
+
+def states_reader(source):
+    # The reader of the per-city, per-day states: a store directory has them precomputed;
+    # for the CSV export they are built from the file. Like the daily summary, the dashboard
+    # loads them in one group with the frame.
+    if os.path.isdir(source):
+        if not os.path.isdir(states_path(source)):
+            rebuild_correlation_states(source)
+        return _read_states
+    return _states_from_csv
+
+
+def load_correlation_states(source):
+    # (version, the per-city, per-day states), cached until the data changes
+    return load_cached(source, states_reader(source))
@@ -0,0 +1,128 @@
+# daily_summary.py
+import os
+
+import pandas as pd
+
+from data_loader import load_cached, read_weather_csv
+from date_tables import read_dates, replace_dates, upsert_dates
+from derived_metrics import daily_metrics
+
+# The summary lives inside the store, one folder per forecast date (see date_tables.py);
+# the leading underscore keeps it out of the forecast dataset
+SUMMARY_FOLDER = '_daily_summary'
+
+# Single-file summary written by earlier versions, replaced by a rebuild
+LEGACY_SUMMARY_FILE = '_daily_summary.parquet'
+
+# Columns of the per-city, per-day table behind the "Weather Overview" tiles
+SUMMARY_COLUMNS = [
+    'city_name', 'forecast_date', 'max_temperature', 'min_temperature', 'total_precipitation',
+    'max_wind_speed', 'sunrise_time', 'sunset_time', 'city_latitude', 'city_longitude',
+    # Derived daily metrics (see derived_metrics.daily_metrics)
+    'diurnal_range', 'total_rain', 'dominant_wind_direction', 'dominant_wind_compass',
+    'mean_dew_point', 'max_heat_index',
+]
+
+
+def summary_path(root):
+    return os.path.join(root, SUMMARY_FOLDER)
+
+
+def build_daily_summary(df):
+    # Aggregate forecast rows into one row per city and forecast date
+    df = df.sort_values('forecast_time')
+    forecast_date = df['forecast_time'].dt.strftime('%Y-%m-%d').rename('forecast_date')
+    grouped = df.groupby(['city_name', forecast_date], sort=True)
+
+    summary = grouped.agg(
+        max_temperature=('temperature', 'max'),
+        min_temperature=('temperature', 'min'),
+        total_precipitation=('precipitation_probability', 'sum'),
+        max_wind_speed=('wind_speed', 'max'),
+        sunrise=('sunrise', 'first'),
+        sunset=('sunset', 'first'),
+        city_latitude=('city_latitude', 'first'),
+        city_longitude=('city_longitude', 'first'),
+    )
+
+    # Derived metrics of each day (diurnal range, rain total, dominant wind, dew point, heat index)
+    summary = summary.join(daily_metrics(df, [df['city_name'], forecast_date])).reset_index()
+
+    # Format sunrise/sunset once here, as 12-hour time (AM/PM), instead of on every render
+    summary['sunrise_time'] = pd.to_datetime(summary['sunrise']).dt.strftime('%I:%M %p')
+    summary['sunset_time'] = pd.to_datetime(summary['sunset']).dt.strftime('%I:%M %p')
+    return summary[SUMMARY_COLUMNS]
+
+
+def update_daily_summary(root, latest):
+    # Recompute the summary rows of the city/date pairs in latest (the latest stored
+    # version of every partition a write touched) and upsert them into the stored summary.
+    # Only the folders of the touched dates are rewritten.
+    if not os.path.isdir(summary_path(root)):
+        # No summary yet, or one written in the earlier single-file layout: build it once from the store
+        rebuild_daily_summary(root)
+        return
+    fresh = build_daily_summary(latest)
+    touched = pd.DataFrame({
+        'city_name': latest['city_name'],
+        'forecast_date': latest['forecast_time'].dt.strftime('%Y-%m-%d'),
+    }).drop_duplicates()
+    upsert_dates(summary_path(root), fresh, touched)
+
+
+def rebuild_daily_summary(root, df=None):
+    # Recompute the whole summary from the store (df: the whole store, when already read)
+    if df is None:
+        from weather_store import read_weather_store
+        df = read_weather_store(root)
+    replace_dates(summary_path(root), build_daily_summary(df))
+    legacy_path = os.path.join(root, LEGACY_SUMMARY_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def _read_summary(root):
+    summary = read_dates(summary_path(root))
+    if summary is None:
+        summary = pd.DataFrame({column: [] for column in SUMMARY_COLUMNS})
+    return summary[SUMMARY_COLUMNS].set_index(['city_name', 'forecast_date']).sort_index()
+
+
+def _summarize_csv(path):
+    return build_daily_summary(read_weather_csv(path)).set_index(['city_name', 'forecast_date']).sort_index()
+
+
+def summary_reader(source):
+    # The reader of the summary indexed by (city_name, forecast_date): a store directory has
+    # it precomputed; for the CSV export it is built from the file. The dashboard loads it
+    # in one group with the frame (data_loader.load_cached_group), so both switch together.
+    if os.path.isdir(source):
+        if not os.path.isdir(summary_path(source)):
+            rebuild_daily_summary(source)
+        return _read_summary
+    return _summarize_csv
+
+
+def load_daily_summary(source):
+    # (version, the summary), cached until the data changes. The cache goes by the data
+    # version (a store's published _VERSION, not the summary's own files).
+    return load_cached(source, summary_reader(source))
+
+
+def city_daily_summary(summary, city, start=None, end=None):
+    # A city's summary rows for the forecast days from start to end (both optional), by
+    # slicing the sorted index rather than scanning the table
+    if city not in summary.index.get_level_values(0):
+        return summary.iloc[0:0].reset_index()
+    days = summary.loc[city]
+    start = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+    end = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+    return days.loc[start:end].reset_index()
+
+
+def lookup_daily_summary(summary, city, date):
+    # One indexed lookup for a city's tiles on a given day; None when there is no forecast
+    try:
+        return summary.loc[(city, pd.Timestamp(date).strftime('%Y-%m-%d'))]
+    except KeyError:
+        return None
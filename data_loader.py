@@ -0,0 +1,364 @@
+# data_loader.py
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from derived_metrics import add_metric_columns
+from time_index import sort_weather_frame
+
+# Default location of the processed weather data
+DATA_PATH = 'transformed_weather_data.csv'
+
+# Explicit column types for the transformed weather data, so pandas doesn't have to infer them
+WEATHER_DTYPES = {
+    'temperature': 'float64',
+    'feels_like_temperature': 'float64',
+    'min_temperature': 'float64',
+    'max_temperature': 'float64',
+    'pressure': 'float64',
+    'humidity': 'float64',
+    'cloudiness': 'float64',
+    'wind_speed': 'float64',
+    'wind_direction': 'float64',
+    'visibility': 'float64',
+    'precipitation_probability': 'float64',
+    'rain_volume': 'float64',
+    'weather_main': 'object',
+    'weather_description': 'object',
+    'city_name': 'object',
+    'country': 'object',
+    'city_latitude': 'float64',
+    'city_longitude': 'float64',
+    'population': 'int64',
+    'timezone': 'object',
+}
+
+# Timestamp columns, all written by the notebook as "2024-09-15 13:00:00"
+DATE_COLUMNS = ['forecast_time', 'sunrise', 'sunset']
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Compact in-memory types for the cached frame. Measures are held as float32 where the
+# values survive the round trip at the precision OpenWeatherMap reports them with
+# ({column: decimals}); repeated strings become categoricals.
+FLOAT32_DECIMALS = {
+    'temperature': 2,
+    'feels_like_temperature': 2,
+    'min_temperature': 2,
+    'max_temperature': 2,
+    'pressure': 0,
+    'humidity': 0,
+    'cloudiness': 0,
+    'wind_speed': 2,
+    'wind_direction': 0,
+    'visibility': 0,
+    'precipitation_probability': 2,
+    'rain_volume': 2,
+    'city_latitude': 4,
+    'city_longitude': 4,
+    'dew_point': 2,
+    'heat_index': 2,
+}
+CATEGORY_COLUMNS = ['weather_main', 'weather_description', 'city_name', 'country', 'timezone']
+INT32_COLUMNS = ['population']
+
+# Loaded frames are written once per data version as uncompressed Arrow files here and
+# memory-mapped, so every process on the host shares the same pages
+FRAME_CACHE_PATH = '.frame_cache'
+
+# Layout of the frames parse_weather_data builds (columns, types, row order), part of every
+# cached file's name so a frame written by older code is never mapped by newer code.
+# Bump it whenever parse_weather_data, or anything it calls, changes its output.
+FRAME_FORMAT = 1
+
+# A store publishes each new version by atomically replacing this pointer file; readers
+# go by it instead of the files, so they only switch once a write is complete
+VERSION_FILE = '_VERSION'
+
+# Parsed frames shared by every rerun and every session of this process: {(path, reader): (version, frame)}
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Keys whose new version is being read in the background
+_reloading = set()
+
+# Keys whose background read failed: {key: (version, failures, retry_at)}. The same version
+# is retried after RELOAD_RETRY_INITIAL seconds, doubling per failure up to RELOAD_RETRY_MAX.
+_failed = {}
+RELOAD_RETRY_INITIAL = 5
+RELOAD_RETRY_MAX = 300
+
+# Hit/miss/reload counters for the loader cache (stale: an older version served during a reload)
+loader_stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'stale': 0, 'reload_failures': 0}
+
+log = logging.getLogger('data_loader')
+
+
+def _data_files(path):
+    # The CSV itself, or every file of a partitioned store directory
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(
+        os.path.join(folder, name)
+        for folder, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def data_version(path=DATA_PATH, use_hash=False):
+    # Identify the current contents of the data file (or store directory).
+    # A store with a published version pointer is identified by it (one small read).
+    # Otherwise mtime + size is a cheap stat call; the content hash is exact but reads every byte.
+    version_path = os.path.join(path, VERSION_FILE)
+    if os.path.isdir(path) and os.path.exists(version_path):
+        with open(version_path) as f:
+            return f.read().strip()
+
+    files = _data_files(path)
+
+    if use_hash:
+        digest = hashlib.sha256()
+        for file in files:
+            digest.update(os.path.relpath(file, path).encode())
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    stats = [os.stat(file) for file in files]
+    latest = max((stat.st_mtime_ns for stat in stats), default=0)
+    total_size = sum(stat.st_size for stat in stats)
+    return f'{latest}-{total_size}-{len(stats)}'
+
+
+def read_weather_csv(path=DATA_PATH):
+    # Parse the CSV with the declared schema instead of letting pandas infer it
+    return pd.read_csv(
+        path,
+        dtype=WEATHER_DTYPES,
+        parse_dates=DATE_COLUMNS,
+        date_format=DATE_FORMAT,
+    )
+
+
+def _restore_float(values, decimals):
+    # float32 back to the float64 the CSV would have parsed: rounding at the reported
+    # precision gives exactly the nearest double of the original decimal
+    return values.astype('float64').round(decimals)
+
+
+def compact_weather_frame(df):
+    # Shrink the frame with the compact types above. A measure stays float64 when float32
+    # can't hold its values exactly at the declared precision, so nothing is ever lost.
+    df = df.copy(deep=False)
+    for column, decimals in FLOAT32_DECIMALS.items():
+        if column in df and df[column].dtype == 'float64':
+            compact = df[column].astype('float32')
+            if _restore_float(compact, decimals).equals(df[column]):
+                df[column] = compact
+    for column in CATEGORY_COLUMNS:
+        if column in df and df[column].dtype == 'object':
+            df[column] = df[column].astype('category')
+    for column in INT32_COLUMNS:
+        if column in df and df[column].dtype == 'int64' and df[column].abs().max() < 2 ** 31:
+            df[column] = df[column].astype('int32')
+    for column in DATE_COLUMNS:
+        if column in df and df[column].dtype == 'object':
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    return df
+
+
+def expand_weather_frame(df):
+    # The frame with the original column types (float64 measures, object strings), so
+    # anything built from it comes out exactly as it would from the CSV. Meant for the
+    # slices a figure is built from, not the whole cached frame.
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if df[column].dtype == 'float32':
+            df[column] = _restore_float(df[column], FLOAT32_DECIMALS.get(column, 6))
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('object')
+        elif column in INT32_COLUMNS and df[column].dtype == 'int32':
+            df[column] = df[column].astype('int64')
+    return df
+
+
+def memory_report(before, after):
+    # Bytes per column before and after compaction, with a total row
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(index=False, deep=True),
+        'dtype_after': after.dtypes.astype(str),
+        'bytes_after': after.memory_usage(index=False, deep=True),
+    })
+    report.loc['total'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    return report
+
+
+def add_derived_columns(df):
+    # Columns the dashboard derives from the data, computed once at load time:
+    #   date: forecast day as "23 Aug" (formatted once per distinct day, kept as a categorical)
+    day_codes, days = pd.factorize(df['forecast_time'].dt.normalize())
+    label_codes, labels = pd.factorize(pd.Index(days.strftime('%d %b')))
+    codes = np.where(day_codes >= 0, label_codes[day_codes], -1)
+    df['date'] = pd.Categorical.from_codes(codes, categories=labels)
+    return df
+
+
+def parse_weather_data(path=DATA_PATH):
+    # A directory is the partitioned Parquet store, anything else the CSV export.
+    # The frame comes back in the compact types, with the derived columns added, sorted by
+    # (city, forecast_time) for the time index. Dew point and heat index are computed here,
+    # over whole columns, once per data version. Any change to the frame built here needs
+    # a new FRAME_FORMAT, or hosts keep mapping frames cached by the older code.
+    if os.path.isdir(path):
+        from weather_store import read_weather_store
+        df = read_weather_store(path)
+    else:
+        df = read_weather_csv(path)
+    return add_derived_columns(compact_weather_frame(add_metric_columns(sort_weather_frame(df))))
+
+
+def shared_frame_path(path, version):
+    # Arrow file of one version of the data at path, as built by this frame format
+    source = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(FRAME_CACHE_PATH, f'{source}-f{FRAME_FORMAT}-{version}.arrow')
+
+
+def write_arrow_frame(df, arrow_path):
+    # Write the frame as an uncompressed Arrow IPC file (so it can be mapped as is), atomically
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    temp_path = f'{arrow_path}.{uuid.uuid4().hex}.tmp'
+    with pa.OSFile(temp_path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temp_path, arrow_path)
+
+
+def map_arrow_frame(arrow_path):
+    # Memory-map the Arrow file and view it as a read-only frame. Numeric and timestamp
+    # columns point straight into the mapped pages (no copy); the mapping stays open for
+    # as long as the frame is alive.
+    table = ipc.open_file(pa.memory_map(arrow_path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def read_weather_data(path=DATA_PATH):
+    # The weather data as a view of the shared Arrow file for its current version, parsing
+    # it only when no process on this host has written that version yet
+    arrow_path = shared_frame_path(path, data_version(path))
+    if not os.path.exists(arrow_path):
+        os.makedirs(FRAME_CACHE_PATH, exist_ok=True)
+        write_arrow_frame(parse_weather_data(path), arrow_path)
+
+        # Older versions (and formats) of the same source are no longer needed (mapped
+        # pages stay valid for any process still using them)
+        prefix = os.path.basename(arrow_path).split('-', 1)[0] + '-'
+        for name in os.listdir(FRAME_CACHE_PATH):
+            old_path = os.path.join(FRAME_CACHE_PATH, name)
+            if name.startswith(prefix) and name.endswith('.arrow') and old_path != arrow_path:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+    return map_arrow_frame(arrow_path)
+
+
+def _reload(key, path, readers, version):
+    # Read a new version in the background, every reader of the group, and publish the
+    # results together. On failure (e.g. files removed by a compaction mid-read) the loaded
+    # version stays in place and the read is retried after a growing delay.
+    try:
+        frames = tuple(reader(path) for reader in readers)
+    except Exception:
+        log.exception('Reading version %s of %s failed', version, path)
+        frames = None
+    with _cache_lock:
+        _reloading.discard(key)
+        if frames is not None:
+            _cache[key] = (version, frames)
+            _failed.pop(key, None)
+            loader_stats['reloads'] += 1
+        else:
+            failed = _failed.get(key)
+            failures = failed[1] if failed is not None and failed[0] == version else 0
+            delay = min(RELOAD_RETRY_INITIAL * 2 ** failures, RELOAD_RETRY_MAX)
+            _failed[key] = (version, failures + 1, time.monotonic() + delay)
+            loader_stats['reload_failures'] += 1
+
+
+def load_cached_group(path, readers, use_hash=False):
+    # Return (version, [reader(path) for reader in readers]), calling the readers again only
+    # when the data at path has changed. Only the first load waits for the readers: when the
+    # data changes, the loaded version keeps being served while the new one is read in a
+    # background thread, so page loads never block. The readers of a group (e.g. the frame
+    # and the tables derived from it) are read one after another in that thread and switch
+    # in the same rerun.
+    # The version and frames come from one read of the cache, so they always belong together:
+    # anything cached per version (indexes, figures) must be keyed on this version.
+    key = (os.path.abspath(path),) + tuple((reader.__module__, reader.__name__) for reader in readers)
+    version = data_version(path, use_hash)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            loader_stats['hits'] += 1
+        elif cached is not None:
+            loader_stats['stale'] += 1
+            failed = _failed.get(key)
+            retry_later = failed is not None and failed[0] == version and time.monotonic() < failed[2]
+            if key not in _reloading and not retry_later:
+                _reloading.add(key)
+                threading.Thread(target=_reload, args=(key, path, readers, version), daemon=True).start()
+        else:
+            cached = (version, tuple(reader(path) for reader in readers))
+            loader_stats['misses'] += 1
+            _cache[key] = cached
+
+    # Hand out shallow copies so callers adding columns don't touch the shared frames
+    return cached[0], [frame.copy(deep=False) for frame in cached[1]]
+
+
+def load_cached(path, reader, use_hash=False):
+    # Return (version, reader(path)), cached like a group of one reader
+    version, [frame] = load_cached_group(path, [reader], use_hash)
+    return version, frame
+
+
+def load_weather_data(path=DATA_PATH, use_hash=False):
+    # Return (version, parsed weather data), re-reading it only when it has changed
+    return load_cached(path, read_weather_data, use_hash)
+
+
+def get_loader_stats():
+    # Snapshot of the loader cache counters
+    with _cache_lock:
+        return dict(loader_stats)
+
+
+def clear_cache():
+    # Drop every cached frame and failed reload (the counters are kept)
+    with _cache_lock:
+        _cache.clear()
+        _failed.clear()
+
+
+if __name__ == '__main__':
+    # Memory used by the weather frame before and after compaction: python data_loader.py [path]
+    path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+    if os.path.isdir(path):
+        from weather_store import read_weather_store
+        full = read_weather_store(path)
+    else:
+        full = read_weather_csv(path)
+    report = memory_report(full, compact_weather_frame(full))
+    print(report.to_string())
+    before, after = report.loc['total', 'bytes_before'], report.loc['total', 'bytes_after']
+    print(f'{before:,} -> {after:,} bytes ({after / before:.0%})')
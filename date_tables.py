@@ -0,0 +1,110 @@
+# date_tables.py
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Per-city, per-day tables derived from the store (the daily summary and the correlation
+# states) are kept as one folder per forecast date inside the store:
+#   weather_store/_daily_summary/forecast_date=2024-09-15/part-<uuid>.parquet
+# An ingest run only rewrites the dates it touched, so its cost follows the batch rather
+# than the length of the history.
+#
+# Files are never modified in place: a writer merges a date's files with its fresh rows
+# into a new file under a unique name, then removes the files it merged. Two writers
+# updating the same date at once can briefly leave two merged files; readers take the
+# most recently computed row of each (city_name, forecast_date), so neither loses rows.
+
+KEY_COLUMNS = ['city_name', 'forecast_date']
+
+# When each row was computed (nanoseconds since the epoch), to pick the latest between files
+UPDATED_COLUMN = '_updated_at'
+
+
+def date_folder(folder, date):
+    return os.path.join(folder, f'forecast_date={date}')
+
+
+def _date_folders(folder):
+    if not os.path.isdir(folder):
+        return []
+    return [entry.path for entry in os.scandir(folder) if entry.is_dir() and entry.name.startswith('forecast_date=')]
+
+
+def _part_files(folder):
+    # Finished files of one date, skipping the temporary files of a write in progress
+    if not os.path.isdir(folder):
+        return []
+    return [entry.path for entry in os.scandir(folder)
+            if entry.name.endswith('.parquet') and not entry.name.startswith(('.', '_'))]
+
+
+def _read_files(files):
+    # The files as one table; a file merged away by another writer since it was listed is
+    # skipped, its rows are in that writer's merged file
+    tables = []
+    for file in files:
+        try:
+            tables.append(pq.read_table(file))
+        except FileNotFoundError:
+            continue
+    if not tables:
+        return None
+    # Columns that are all null in one file (e.g. no dominant wind) come back as strings from another
+    return pa.concat_tables(tables, promote_options='default')
+
+
+def _latest(df):
+    df = df.sort_values(UPDATED_COLUMN, kind='stable')
+    return df.drop_duplicates(KEY_COLUMNS, keep='last')
+
+
+def upsert_dates(folder, rows, touched):
+    # Replace the rows of the (city_name, forecast_date) pairs in touched with rows (the
+    # fresh rows of those pairs; a touched pair without a fresh row is removed).
+    # Only the folders of the touched dates are read and rewritten.
+    stamp = time.time_ns()
+    rows = rows.assign(**{UPDATED_COLUMN: stamp})
+    for date, pairs in touched.groupby('forecast_date', sort=True):
+        target = date_folder(folder, date)
+        files = _part_files(target)
+        fresh = rows[rows['forecast_date'] == date]
+
+        stored = _read_files(files)
+        if stored is not None:
+            stored = stored.to_pandas()
+            # Rows computed before this write are replaced; a newer row from a concurrent writer wins
+            replaced = stored['city_name'].isin(pairs['city_name']) & (stored[UPDATED_COLUMN] < stamp)
+            fresh = _latest(pd.concat([stored[~replaced], fresh], ignore_index=True))
+
+        if len(fresh):
+            os.makedirs(target, exist_ok=True)
+            name = f'part-{uuid.uuid4().hex}.parquet'
+            temp_path = os.path.join(target, f'.{name}.tmp')
+            fresh.sort_values('city_name', ignore_index=True).to_parquet(temp_path, index=False)
+            os.replace(temp_path, os.path.join(target, name))
+        for file in files:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+
+def replace_dates(folder, rows):
+    # Rewrite the whole table with rows (used to rebuild it from the store)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    upsert_dates(folder, rows, rows[KEY_COLUMNS].drop_duplicates())
+
+
+def read_dates(folder):
+    # The whole table, sorted by city and forecast date (None when nothing was written yet)
+    table = _read_files([file for date in _date_folders(folder) for file in _part_files(date)])
+    if table is None:
+        return None
+    df = _latest(table.to_pandas()).drop(columns=UPDATED_COLUMN)
+    return df.sort_values(KEY_COLUMNS, ignore_index=True)
@@ -0,0 +1,126 @@
+# derived_metrics.py
+import numpy as np
+import pandas as pd
+
+# Metrics derived from the forecast columns. Everything here works on whole columns (all
+# cities at once) with NumPy, and runs when the data is loaded or ingested, never per rerun.
+
+# Magnus formula coefficients for the dew point over water (Alduchov & Eskridge)
+MAGNUS_B = 17.625
+MAGNUS_C = 243.04
+
+# Row-level metric columns, rounded like the temperatures they sit next to
+METRIC_COLUMNS = ['dew_point', 'heat_index']
+METRIC_DECIMALS = 2
+
+# 16-point compass, clockwise from north
+COMPASS_POINTS = np.array(['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                           'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW'], dtype=object)
+
+# Below this resultant wind speed (m/s) the day's winds cancel out and there is no dominant direction
+CALM_WIND_SPEED = 0.1
+
+
+def dew_point(temperature, humidity):
+    # Dew point (°C) from the temperature (°C) and relative humidity (%); NaN for 0% humidity
+    temperature = np.asarray(temperature, dtype='float64')
+    humidity = np.asarray(humidity, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(humidity / 100) + MAGNUS_B * temperature / (MAGNUS_C + temperature)
+        dew = MAGNUS_C * gamma / (MAGNUS_B - gamma)
+    return np.where(humidity > 0, dew, np.nan)
+
+
+def heat_index(temperature, humidity):
+    # NOAA heat index (°C): Steadman's simple formula when it comes out below 80°F, the
+    # Rothfusz regression (with its low/high humidity adjustments) above
+    t = np.asarray(temperature, dtype='float64') * 9 / 5 + 32
+    rh = np.asarray(humidity, dtype='float64')
+
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    full = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+            - 0.00683783 * t * t - 0.05481717 * rh * rh + 0.00122874 * t * t * rh
+            + 0.00085282 * t * rh * rh - 0.00000199 * t * t * rh * rh)
+    with np.errstate(invalid='ignore'):
+        dry = (rh < 13) & (t >= 80) & (t <= 112)
+        full = full - np.where(dry, (13 - rh) / 4 * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17), 0)
+        humid = (rh > 85) & (t >= 80) & (t <= 87)
+        full = full + np.where(humid, (rh - 85) / 10 * ((87 - t) / 5), 0)
+
+    fahrenheit = np.where((simple + t) / 2 >= 80, full, simple)
+    return (fahrenheit - 32) * 5 / 9
+
+
+def add_metric_columns(df):
+    # Add the row-level metrics to a frame of forecast rows (a new frame; df is not modified)
+    temperature = df['temperature'].to_numpy(dtype='float64')
+    humidity = df['humidity'].to_numpy(dtype='float64')
+    return df.assign(
+        dew_point=np.round(dew_point(temperature, humidity), METRIC_DECIMALS),
+        heat_index=np.round(heat_index(temperature, humidity), METRIC_DECIMALS),
+    )
+
+
+def wind_vectors(speed, direction):
+    # East/north components of each wind reading (direction in degrees, clockwise from north)
+    radians = np.deg2rad(np.asarray(direction, dtype='float64'))
+    speed = np.asarray(speed, dtype='float64')
+    return speed * np.sin(radians), speed * np.cos(radians)
+
+
+def vector_direction(east, north):
+    # Direction (degrees from north) of summed wind vectors; NaN when they cancel out
+    east = np.asarray(east, dtype='float64')
+    north = np.asarray(north, dtype='float64')
+    degrees = np.rad2deg(np.arctan2(east, north)) % 360
+    return np.where(np.hypot(east, north) >= CALM_WIND_SPEED, degrees, np.nan)
+
+
+def compass_point(degrees):
+    # 16-point compass label of each direction (None where the direction is NaN)
+    degrees = np.asarray(degrees, dtype='float64')
+    sectors = np.round(np.nan_to_num(degrees) / 22.5).astype('int64') % 16
+    return np.where(np.isnan(degrees), None, COMPASS_POINTS[sectors])
+
+
+def daily_metrics(df, keys):
+    # Per-day rollups of the forecast rows, grouped by keys (Series aligned with df, e.g.
+    # the city names and forecast dates):
+    #   diurnal_range            highest max_temperature minus lowest min_temperature (°C)
+    #   total_rain               sum of the 3-hour rain volumes (mm)
+    #   dominant_wind_direction  direction of the speed-weighted mean wind vector (degrees),
+    #                            since the arithmetic mean of angles is meaningless
+    #   dominant_wind_compass    the same as a 16-point compass label
+    #   mean_dew_point / max_heat_index
+    # Returns a frame indexed by the group keys, sorted like df.groupby(keys).
+    east, north = wind_vectors(df['wind_speed'], df['wind_direction'])
+    temperature = df['temperature'].to_numpy(dtype='float64')
+    humidity = df['humidity'].to_numpy(dtype='float64')
+    parts = pd.DataFrame({
+        'high': df['max_temperature'].to_numpy(dtype='float64'),
+        'low': df['min_temperature'].to_numpy(dtype='float64'),
+        'rain': df['rain_volume'].to_numpy(dtype='float64'),
+        'east': east,
+        'north': north,
+        'dew_point': dew_point(temperature, humidity),
+        'heat_index': heat_index(temperature, humidity),
+    }, index=df.index)
+    grouped = parts.groupby(keys, sort=True).agg(
+        high=('high', 'max'),
+        low=('low', 'min'),
+        total_rain=('rain', 'sum'),
+        east=('east', 'sum'),
+        north=('north', 'sum'),
+        mean_dew_point=('dew_point', 'mean'),
+        max_heat_index=('heat_index', 'max'),
+    )
+
+    direction = vector_direction(grouped['east'], grouped['north'])
+    return pd.DataFrame({
+        'diurnal_range': (grouped['high'] - grouped['low']).round(METRIC_DECIMALS),
+        'total_rain': grouped['total_rain'].round(METRIC_DECIMALS),
+        'dominant_wind_direction': direction,
+        'dominant_wind_compass': compass_point(direction),
+        'mean_dew_point': grouped['mean_dew_point'].round(METRIC_DECIMALS),
+        'max_heat_index': grouped['max_heat_index'].round(METRIC_DECIMALS),
+    }, index=grouped.index)
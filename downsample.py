@@ -0,0 +1,75 @@
+# downsample.py
+import numpy as np
+
+# Roughly one point per horizontal pixel of a half-width chart in the wide layout
+CHART_WIDTH_PX = 700
+
+
+def _as_float(values):
+    # Timestamps become nanoseconds so they can be used in the area arithmetic
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype('datetime64[ns]').astype('int64')
+    return values.astype('float64')
+
+
+def lttb_indices(x, y, threshold=CHART_WIDTH_PX):
+    # Largest-Triangle-Three-Buckets: pick `threshold` row positions that keep the visual
+    # shape of a line (peaks and troughs included). First and last points are always kept.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = _as_float(y)
+
+    # threshold - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # Average point of the next bucket (just the last point for the final bucket)
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        # Keep the point forming the largest triangle with the previous pick and the next average
+        area = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[bucket + 1] = selected
+
+    return indices
+
+
+def minmax_indices(*series, max_points=CHART_WIDTH_PX):
+    # Min/max envelope: split the rows into buckets and keep each bucket's lowest and
+    # highest point of every series, so filled areas keep their peaks. A series that is
+    # missing for a whole bucket has no extremes there; a bucket where every series is
+    # missing keeps its first row, so the chart shows the gap instead of bridging it.
+    n = len(series[0])
+    buckets = max_points // 2
+    if n <= max_points or buckets < 1:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    keep = np.zeros(n, dtype=bool)
+    for values in series:
+        values = _as_float(values)
+        for start, end in zip(edges[:-1], edges[1:]):
+            if end > start and not np.isnan(values[start:end]).all():
+                keep[start + np.nanargmin(values[start:end])] = True
+                keep[start + np.nanargmax(values[start:end])] = True
+
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start and not keep[start:end].any():
+            keep[start] = True
+
+    return np.flatnonzero(keep)
@@ -0,0 +1,202 @@
+# fetcher.py
+import asyncio
+import collections
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import pandas as pd
+from dotenv import load_dotenv
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+from ingest import flatten_forecasts
+from response_cache import CACHE_PATH, ResponseCache, format_report
+from weather_store import STORE_PATH, append_weather_store
+
+# OpenWeatherMap 5 day / 3 hour forecast endpoint
+FORECAST_URL = 'https://api.openweathermap.org/data/2.5/forecast'
+
+# Defaults sized for the free OpenWeatherMap plan (60 calls/minute)
+MAX_CONCURRENCY = 10
+REQUESTS_PER_MINUTE = 60
+MAX_ATTEMPTS = 5
+
+# Status codes worth retrying: rate limited, or a transient server error
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    # Sliding window over the send times of the last `period` seconds: at most
+    # requests_per_minute requests go out in any window of that length. A Retry-After
+    # from the server pauses every sender sharing the limiter.
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, period=60):
+        self.max_requests = requests_per_minute
+        self.period = period
+        self.sent = collections.deque()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.sent and self.sent[0] <= now - self.period:
+                    self.sent.popleft()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif len(self.sent) < self.max_requests:
+                    self.sent.append(now)
+                    return
+                else:
+                    # Wait for the oldest send to leave the window
+                    delay = self.sent[0] + self.period - now
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        # Hold every request back for `seconds` (e.g. a 429's Retry-After)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after(response):
+    # Seconds the server asks us to wait before retrying (Retry-After given as seconds
+    # or as an HTTP date), or None when it doesn't say
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+# Backoff between attempts when the server doesn't send a Retry-After
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+
+def _retry_wait(retry_state):
+    # Wait as long as the server's Retry-After asks, otherwise back off exponentially with jitter
+    error = retry_state.outcome.exception()
+    if isinstance(error, httpx.HTTPStatusError):
+        delay = retry_after(error.response)
+        if delay is not None:
+            return delay
+    return _backoff(retry_state)
+
+
+def _is_retryable(error):
+    # Network errors and retryable HTTP statuses are retried, anything else (e.g. 401) is not
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+async def fetch_forecast(client, limiter, lat, lon, api_key, units='metric', url=FORECAST_URL,
+                         max_attempts=MAX_ATTEMPTS, cache=None):
+    # Fetch one location's forecast, with exponential backoff between attempts (or the
+    # server's Retry-After, when it sends one).
+    # With a cache, a fresh entry skips the request and a stale one is revalidated.
+    headers = {}
+    if cache is not None:
+        body, headers = cache.lookup(lat, lon, units)
+        if body is not None:
+            return body
+
+    params = {'lat': lat, 'lon': lon, 'appid': api_key, 'units': units}
+
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception(_is_retryable),
+        wait=_retry_wait,
+        stop=stop_after_attempt(max_attempts),
+        reraise=True,
+    ):
+        with attempt:
+            await limiter.acquire()
+            response = await client.get(url, params=params, headers=headers)
+            if cache is not None and response.status_code == 304:
+                body = cache.revalidated(lat, lon, units)
+                if body is not None:
+                    return body
+                # The entry went away after the lookup: fetch the full body without validators
+                headers = {}
+                await limiter.acquire()
+                response = await client.get(url, params=params)
+            if response.status_code == 429:
+                # Rate limited: every sender backs off for as long as the server asks
+                delay = retry_after(response)
+                if delay is not None:
+                    limiter.pause(delay)
+            response.raise_for_status()
+
+            if cache is None:
+                return response.json()
+            if headers:
+                cache.record_miss()
+            return cache.store(lat, lon, units, response)
+
+
+async def fetch_forecasts(locations, api_key, units='metric', url=FORECAST_URL,
+                          max_concurrency=MAX_CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                          max_attempts=MAX_ATTEMPTS, cache=None):
+    # Fetch every (lat, lon) in locations over one pooled client.
+    # Returns the responses in the same order; a location that still fails after
+    # retrying gets its exception in place of a response.
+    limiter = RateLimiter(requests_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(30.0)) as client:
+        async def fetch_one(lat, lon):
+            async with semaphore:
+                return await fetch_forecast(client, limiter, lat, lon, api_key, units, url, max_attempts, cache)
+
+        return await asyncio.gather(
+            *(fetch_one(lat, lon) for lat, lon in locations),
+            return_exceptions=True,
+        )
+
+
+def fetch_and_ingest(locations, api_key, root=STORE_PATH, **fetch_options):
+    # Fetch all locations, flatten the responses and append new or changed rows to the Parquet store.
+    # Returns (number of rows written, failed locations).
+    responses = asyncio.run(fetch_forecasts(locations, api_key, **fetch_options))
+
+    fetched = []
+    failures = []
+    for location, response in zip(locations, responses):
+        if isinstance(response, Exception):
+            failures.append((location, response))
+        else:
+            fetched.append(response)
+
+    # All successful responses are flattened together in one batch
+    written = append_weather_store(flatten_forecasts(fetched), root) if fetched else 0
+    return written, failures
+
+
+if __name__ == '__main__':
+    # Fetch every location in a CSV with lat/lon columns: python fetcher.py locations.csv [store_path]
+    # Responses are cached on disk, so locations fetched earlier in the same forecast step are free
+    load_dotenv()
+    api_key = os.getenv("OPENWEATHER_API_KEY")
+
+    locations = pd.read_csv(sys.argv[1])[['lat', 'lon']].itertuples(index=False, name=None)
+    store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_PATH
+
+    cache = ResponseCache(CACHE_PATH)
+    written, failures = fetch_and_ingest(list(locations), api_key, store_path, cache=cache)
+    print(f'Wrote {written} new or changed forecast rows to {store_path}')
+
+    print(format_report(cache.report()))
+    for (lat, lon), error in failures:
+        print(f'Failed to fetch lat={lat} lon={lon}: {error!r}')
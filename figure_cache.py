@@ -0,0 +1,48 @@
+# figure_cache.py
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+# Serialized figures shared by every rerun and every session:
+# {(data_version, city, chart_id, variant): figure JSON}
+MAX_FIGURES = 256
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+# Hit/miss counters for the figure cache
+figure_stats = {'hits': 0, 'misses': 0}
+
+
+def cached_figure(chart_id, data_version, city, build, variant=None):
+    # Return the figure for this chart, calling build() only when this data version, city,
+    # chart and variant (e.g. a zoom range) has not been rendered before
+    key = (data_version, city, chart_id, variant)
+
+    with _figures_lock:
+        figure_json = _figures.get(key)
+        if figure_json is not None:
+            _figures.move_to_end(key)
+            figure_stats['hits'] += 1
+
+    if figure_json is not None:
+        return pio.from_json(figure_json)
+
+    fig = build()
+    with _figures_lock:
+        figure_stats['misses'] += 1
+
+        # New data has landed: figures built from older versions will never be asked for again
+        for stale_key in [k for k in _figures if k[0] != data_version]:
+            del _figures[stale_key]
+
+        _figures[key] = fig.to_json()
+        while len(_figures) > MAX_FIGURES:
+            _figures.popitem(last=False)
+    return fig
+
+
+def get_figure_stats():
+    # Snapshot of the figure cache counters
+    with _figures_lock:
+        return dict(figure_stats)
@@ -0,0 +1,264 @@
+# ingest.py
+import gzip
+import io
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+from dateutil import tz
+
+from data_loader import WEATHER_DTYPES
+from weather_store import STORE_PATH, WEATHER_COLUMNS, append_weather_store
+
+# Arrow type of one entry of the OpenWeatherMap /forecast 'list' (only the fields we keep).
+# Declaring doubles up front means integer readings like "pressure": 1012 need no
+# convert_int_to_float_except_dt pass first.
+FORECAST_TYPE = pa.struct([
+    ('dt', pa.int64()),
+    ('main', pa.struct([
+        ('temp', pa.float64()),
+        ('feels_like', pa.float64()),
+        ('temp_min', pa.float64()),
+        ('temp_max', pa.float64()),
+        ('pressure', pa.float64()),
+        ('humidity', pa.float64()),
+    ])),
+    ('weather', pa.list_(pa.struct([
+        ('main', pa.string()),
+        ('description', pa.string()),
+    ]))),
+    ('clouds', pa.struct([('all', pa.float64())])),
+    ('wind', pa.struct([('speed', pa.float64()), ('deg', pa.float64())])),
+    ('visibility', pa.float64()),
+    ('pop', pa.float64()),
+    ('rain', pa.struct([('3h', pa.float64())])),
+])
+
+# Arrow type of the 'city' block of a response
+CITY_TYPE = pa.struct([
+    ('name', pa.string()),
+    ('country', pa.string()),
+    ('coord', pa.struct([('lat', pa.float64()), ('lon', pa.float64())])),
+    ('population', pa.int64()),
+    ('timezone', pa.int64()),
+    ('sunrise', pa.int64()),
+    ('sunset', pa.int64()),
+])
+
+# A whole /forecast response; other top-level fields (cod, message, cnt) are ignored
+RESPONSE_SCHEMA = pa.schema([
+    ('list', pa.list_(FORECAST_TYPE)),
+    ('city', CITY_TYPE),
+])
+RESPONSE_TYPE = pa.struct(list(RESPONSE_SCHEMA))
+
+# Newline-delimited JSON archives (one response per line) are flattened this many
+# responses at a time, so memory stays bounded however big the archive is
+NDJSON_BATCH_LINES = 1000
+
+# Spacing of the forecast steps in a /forecast response
+FORECAST_STEP_SECONDS = 3 * 3600
+
+# Country codes replaced with full country names (step 5 of the notebook transform)
+COUNTRY_NAMES = {'NG': 'Nigeria'}
+
+
+def _field(array, path):
+    # Walk a dotted path into a struct array, e.g. 'main.temp'
+    for name in path.split('.'):
+        array = pc.struct_field(array, name)
+    return array
+
+
+def _first_item(lists):
+    # Same as Spark's getItem(0): the first element of each list, null for empty lists
+    parents = pc.list_parent_indices(lists).to_numpy()
+    is_first = np.ones(len(parents), dtype=bool)
+    is_first[1:] = parents[1:] != parents[:-1]
+
+    positions = np.full(len(lists), -1)
+    positions[parents[is_first]] = np.flatnonzero(is_first)
+    indices = pa.array(positions, mask=positions < 0)
+    return pc.take(pc.list_flatten(lists), indices)
+
+
+def from_unixtime(seconds, timezone=None):
+    # Same as Spark's from_unixtime: wall-clock time in the session (by default the local) time zone
+    utc_times = pd.to_datetime(pd.Series(seconds, dtype='int64'), unit='s', utc=True)
+    return utc_times.dt.tz_convert(timezone or tz.tzlocal()).dt.tz_localize(None)
+
+
+def format_utc_offset(seconds):
+    # 3600 -> "UTC+1", -16200 -> "UTC-4" (hours truncated, like the notebook's cast("int"))
+    sign = '+' if seconds >= 0 else '-'
+    return f'UTC{sign}{int(abs(seconds) / 3600)}'
+
+
+def flatten_columns(lists, cities, timezone=None):
+    # Flatten the 'list' and 'city' columns of many responses (Arrow arrays, one item per
+    # response) into the df_flat schema in one pass, without a SparkSession: the forecast
+    # entries of all responses become one struct array, and each city is repeated over its
+    # forecast rows instead of cross-joined
+    forecasts = pc.list_flatten(lists)
+    owners = pc.list_parent_indices(lists).to_numpy()
+    weather = _first_item(pc.struct_field(forecasts, 'weather'))
+
+    df = pd.DataFrame({
+        'forecast_time': from_unixtime(_field(forecasts, 'dt').to_numpy(), timezone),
+        'temperature': _field(forecasts, 'main.temp'),
+        'feels_like_temperature': _field(forecasts, 'main.feels_like'),
+        'min_temperature': _field(forecasts, 'main.temp_min'),
+        'max_temperature': _field(forecasts, 'main.temp_max'),
+        'pressure': _field(forecasts, 'main.pressure'),
+        'humidity': _field(forecasts, 'main.humidity'),
+        'cloudiness': _field(forecasts, 'clouds.all'),
+        'wind_speed': _field(forecasts, 'wind.speed'),
+        'wind_direction': _field(forecasts, 'wind.deg'),
+        'visibility': _field(forecasts, 'visibility'),
+        'precipitation_probability': _field(forecasts, 'pop'),
+        # Fill missing values for rain_volume (set to 0 if NULL)
+        'rain_volume': pc.fill_null(_field(forecasts, 'rain.3h'), 0.0),
+        'weather_main': pc.struct_field(weather, 'main'),
+        'weather_description': pc.struct_field(weather, 'description'),
+    })
+
+    # City columns, computed once per response and then repeated over its forecast rows
+    country = _field(cities, 'country').to_pandas()
+    offsets = _field(cities, 'timezone').to_pandas()
+    city = pd.DataFrame({
+        'city_name': _field(cities, 'name').to_pandas(),
+        'country': country.map(COUNTRY_NAMES).fillna(country),
+        'city_latitude': _field(cities, 'coord.lat').to_pandas(),
+        'city_longitude': _field(cities, 'coord.lon').to_pandas(),
+        'population': _field(cities, 'population').to_pandas(),
+        'timezone': offsets.map({offset: format_utc_offset(offset) for offset in offsets.unique()}),
+        'sunrise': from_unixtime(_field(cities, 'sunrise').to_numpy(), timezone),
+        'sunset': from_unixtime(_field(cities, 'sunset').to_numpy(), timezone),
+    })
+    for column, values in city.take(owners).reset_index(drop=True).items():
+        df[column] = values
+
+    return df[WEATHER_COLUMNS].astype(WEATHER_DTYPES)
+
+
+def flatten_forecasts(responses, timezone=None):
+    # Flatten many parsed /forecast responses at once; the declared types are applied while
+    # converting to Arrow, so integer readings need no float coercion pass
+    responses = pa.array(responses, type=RESPONSE_TYPE)
+    return flatten_columns(pc.struct_field(responses, 'list'), pc.struct_field(responses, 'city'), timezone)
+
+
+def flatten_forecast(data, timezone=None):
+    # Flatten one /forecast response
+    return flatten_forecasts([data], timezone)
+
+
+def _open_archive(path):
+    # Archives may be gzipped (responses.ndjson.gz)
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _read_ndjson(lines):
+    # Parse a batch of response lines straight into Arrow columns with the declared schema
+    # (pyarrow's JSON reader, no Python dicts)
+    block_size = max(1 << 20, max(len(line) for line in lines) + 1)
+    table = pj.read_json(
+        io.BytesIO(b''.join(lines)),
+        read_options=pj.ReadOptions(block_size=block_size),
+        parse_options=pj.ParseOptions(explicit_schema=RESPONSE_SCHEMA, unexpected_field_behavior='ignore'),
+    )
+    return table['list'].combine_chunks(), table['city'].combine_chunks()
+
+
+def iter_ndjson_responses(path, batch_lines=NDJSON_BATCH_LINES):
+    # Stream a newline-delimited archive of /forecast responses, yielding the 'list' and
+    # 'city' columns of `batch_lines` responses at a time; only one batch is held in memory
+    lines = []
+    with _open_archive(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            lines.append(line if line.endswith(b'\n') else line + b'\n')
+            if len(lines) == batch_lines:
+                yield _read_ndjson(lines)
+                lines = []
+    if lines:
+        yield _read_ndjson(lines)
+
+
+def iter_ndjson_batches(path, batch_lines=NDJSON_BATCH_LINES, timezone=None):
+    # One flattened DataFrame per `batch_lines` responses of an archive
+    for lists, cities in iter_ndjson_responses(path, batch_lines):
+        yield flatten_columns(lists, cities, timezone)
+
+
+def response_issue_times(lists, cities, last_issued):
+    # Issue time of each response of a batch, from the response itself: the list starts at
+    # the first 3-hour step after the request, so the step before it is the latest time the
+    # request is known to have been made by. Responses of one city are kept strictly
+    # increasing in archive order (last_issued: {city: issue time}, carried across batches).
+    # Returns an issue time per response (NaT for a response without forecasts) and the
+    # round of each response: the n-th response of a city in the batch is in round n.
+    owners = pc.list_parent_indices(lists).to_numpy()
+    seconds = _field(pc.list_flatten(lists), 'dt').to_numpy()
+    first = np.full(len(lists), np.iinfo('int64').max)
+    np.minimum.at(first, owners, seconds)
+
+    names = _field(cities, 'name').to_pylist()
+    issued_at = np.full(len(lists), np.datetime64('NaT'), dtype='datetime64[us]')
+    rounds = np.zeros(len(lists), dtype='int64')
+    seen = {}
+    for position, name in enumerate(names):
+        if first[position] == np.iinfo('int64').max:
+            continue
+        issued = np.datetime64(int(first[position]) - FORECAST_STEP_SECONDS, 's').astype('datetime64[us]')
+        if name in last_issued and issued <= last_issued[name]:
+            issued = last_issued[name] + np.timedelta64(1, 'us')
+        last_issued[name] = issued_at[position] = issued
+        rounds[position] = seen.get(name, 0)
+        seen[name] = rounds[position] + 1
+    return issued_at, rounds
+
+
+def ingest_ndjson(path, root=STORE_PATH, batch_lines=NDJSON_BATCH_LINES, timezone=None):
+    # Backfill the Parquet store from an archive. An archive holds successive responses for
+    # the same city, whose forecast times overlap: each one is a version of those rows, so
+    # each is appended as its own version, issued at the time taken from the response.
+    # Responses of different cities never share rows, so a batch is appended in rounds
+    # holding at most one response per city.
+    written = 0
+    last_issued = {}
+    for lists, cities in iter_ndjson_responses(path, batch_lines):
+        df = flatten_columns(lists, cities, timezone)
+        owners = pc.list_parent_indices(lists).to_numpy()
+        issued_at, rounds = response_issue_times(lists, cities, last_issued)
+        row_rounds = rounds[owners]
+        for batch_round in range(rounds.max() + 1 if len(rounds) else 0):
+            rows = row_rounds == batch_round
+            if rows.any():
+                written += append_weather_store(df[rows], root, issued_at=issued_at[owners[rows]])
+    return written
+
+
+def ingest_response(data, root=STORE_PATH, timezone=None):
+    # Flatten a response and append its new or changed rows to the Parquet store
+    df = flatten_forecast(data, timezone)
+    return append_weather_store(df, root)
+
+
+if __name__ == '__main__':
+    # Ingest a saved /forecast response: python ingest.py response.json [store_path]
+    # or an archive with one response per line: python ingest.py responses.ndjson[.gz] [store_path]
+    path = sys.argv[1]
+    store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_PATH
+    if path.endswith(('.ndjson', '.jsonl', '.ndjson.gz', '.jsonl.gz')):
+        written = ingest_ndjson(path, store_path)
+    else:
+        with open(path) as f:
+            response = json.load(f)
+        written = ingest_response(response, store_path)
+    print(f'Wrote {written} new or changed forecast rows to {store_path}')
@@ -0,0 +1,132 @@
+# metrics.py
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from data_loader import get_loader_stats
+from figure_cache import get_figure_stats
+
+# Timing is off unless asked for, so a normal rerun only pays for a flag check per section.
+#   WEATHER_METRICS=1        time every section and serve Prometheus metrics on WEATHER_METRICS_PORT
+#   WEATHER_DEBUG_PANEL=1    time every section and show the last rerun's breakdown in the sidebar
+METRICS_ENABLED = os.getenv('WEATHER_METRICS', '').lower() in ('1', 'true', 'yes')
+DEBUG_PANEL_ENABLED = os.getenv('WEATHER_DEBUG_PANEL', '').lower() in ('1', 'true', 'yes')
+TIMING_ENABLED = METRICS_ENABLED or DEBUG_PANEL_ENABLED
+METRICS_PORT = int(os.getenv('WEATHER_METRICS_PORT', '9108'))
+
+# Shared do-nothing span handed out when timing is off
+_NO_SPAN = nullcontext()
+
+# Prometheus metrics, created on first use so prometheus_client is only imported when enabled
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+log = logging.getLogger('metrics')
+
+# Data version whose frame size was last measured (deep memory_usage is too slow for every rerun)
+_measured_version = None
+
+
+class _CacheCollector:
+    # Reports the loader and figure cache counters at scrape time, straight from the
+    # existing stats dicts, so the cache hot paths are not touched at all
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily
+
+        loader = get_loader_stats()
+        loads = CounterMetricFamily('weather_data_loads', 'Weather data cache lookups', labels=['result'])
+        for result in ('hits', 'misses', 'stale'):
+            loads.add_metric([result], loader[result])
+        yield loads
+        yield CounterMetricFamily('weather_data_reloads', 'Weather data reloaded because its version changed',
+                                  value=loader['reloads'])
+        yield CounterMetricFamily('weather_data_reload_failures', 'Background reads of a new data version that failed',
+                                  value=loader['reload_failures'])
+
+        figures = get_figure_stats()
+        lookups = CounterMetricFamily('weather_figure_cache', 'Figure cache lookups', labels=['result'])
+        for result in ('hits', 'misses'):
+            lookups.add_metric([result], figures[result])
+        yield lookups
+
+
+def _prometheus():
+    # Register the metrics and start the /metrics endpoint once per process (Streamlit
+    # re-executes the app script on every rerun, but imported modules stay loaded)
+    with _metrics_lock:
+        if not _metrics:
+            from prometheus_client import REGISTRY, Gauge, Histogram, start_http_server
+
+            # Start the endpoint before anything is marked as set up. Another Streamlit process
+            # on the host may already serve this port: this one then keeps recording (and the
+            # dashboard keeps working) without an endpoint of its own, instead of failing.
+            try:
+                start_http_server(METRICS_PORT)
+            except OSError as error:
+                log.warning('Prometheus endpoint not started on port %d: %s '
+                            '(set WEATHER_METRICS_PORT to a free port per process)', METRICS_PORT, error)
+
+            metrics = {
+                'section': Histogram('weather_section_seconds', 'Time spent in each dashboard section', ['section']),
+                'rerun': Histogram('weather_rerun_seconds', 'Total time of a dashboard rerun'),
+                'frame_bytes': Gauge('weather_frame_memory_bytes', 'Memory used by the loaded weather frame'),
+            }
+            REGISTRY.register(_CacheCollector())
+            _metrics.update(metrics)
+        return _metrics
+
+
+class RerunTimer:
+    # Collects the section timings of one dashboard rerun
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sections = {}
+        self.total = None
+
+    def span(self, section):
+        # Context manager timing one section; a no-op when timing is disabled
+        if not TIMING_ENABLED:
+            return _NO_SPAN
+        return _Span(self, section)
+
+    def finish(self):
+        # Close the rerun and export its timings; returns {section: seconds}
+        if not TIMING_ENABLED:
+            return {}
+        self.total = time.perf_counter() - self.started
+        if METRICS_ENABLED:
+            metrics = _prometheus()
+            for section, seconds in self.sections.items():
+                metrics['section'].labels(section).observe(seconds)
+            metrics['rerun'].observe(self.total)
+        return self.sections
+
+
+class _Span:
+    def __init__(self, timer, section):
+        self.timer = timer
+        self.section = section
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        # A section entered more than once in a rerun (e.g. two charts sharing a name) adds up
+        elapsed = time.perf_counter() - self.started
+        self.timer.sections[self.section] = self.timer.sections.get(self.section, 0.0) + elapsed
+
+        # A fragment rerun runs its sections after the full rerun was finished: export them directly
+        if self.timer.total is not None and METRICS_ENABLED:
+            _prometheus()['section'].labels(self.section).observe(elapsed)
+        return False
+
+
+def record_frame_memory(data_version, df):
+    # Update the loaded-frame memory gauge, measuring only when a new data version is loaded
+    global _measured_version
+    if not METRICS_ENABLED or data_version == _measured_version:
+        return
+    _prometheus()['frame_bytes'].set(int(df.memory_usage(deep=True).sum()))
+    _measured_version = data_version
@@ -0,0 +1,165 @@
+# refresh.py
+import argparse
+import json
+import logging
+import os
+import random
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from fetcher import fetch_and_ingest
+from response_cache import CACHE_PATH, FORECAST_STEP_SECONDS, ResponseCache, format_report, next_forecast_step
+from weather_store import STORE_PATH, export_csv
+
+# OpenWeatherMap publishes a new forecast run every 3 hours; refresh a little after each
+# step boundary, when the new run is out, with random jitter so many instances (or many
+# cities' services) don't all call the API in the same second
+REFRESH_DELAY_SECONDS = 10 * 60
+REFRESH_JITTER_SECONDS = 5 * 60
+
+# A failed refresh is retried with exponential backoff (and full jitter) instead of
+# waiting for the next forecast step
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 30 * 60
+
+# Raise the staleness alarm when the last successful refresh is older than two forecast steps
+MAX_STALENESS_SECONDS = 2 * FORECAST_STEP_SECONDS
+
+# Status of the service, kept inside the store (the leading underscore keeps it out of the dataset)
+STATUS_FILE = '_refresh_status.json'
+
+log = logging.getLogger('refresh')
+
+
+class RefreshError(Exception):
+    pass
+
+
+def next_refresh_time(now, every_steps=1, delay=REFRESH_DELAY_SECONDS, jitter=REFRESH_JITTER_SECONDS, rng=random):
+    # Next run: `delay` seconds after the next forecast step boundary (every `every_steps`
+    # steps, counted from midnight UTC), plus up to `jitter` seconds
+    boundary = next_forecast_step(now - delay)
+    while (boundary // FORECAST_STEP_SECONDS) % every_steps:
+        boundary += FORECAST_STEP_SECONDS
+    return boundary + delay + rng.uniform(0, jitter)
+
+
+def retry_delay(failures, base=RETRY_BASE_SECONDS, cap=RETRY_MAX_SECONDS, rng=random):
+    # Exponential backoff with full jitter after `failures` consecutive failed refreshes
+    return rng.uniform(0, min(cap, base * 2 ** (failures - 1)))
+
+
+def read_status(root):
+    path = os.path.join(root, STATUS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_status(root, status):
+    # Replace the status file atomically
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, STATUS_FILE)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def refresh_once(locations, api_key, root=STORE_PATH, csv_path=None, **fetch_options):
+    # Fetch, flatten and append one forecast run. New store files are staged and renamed into
+    # place before the store's version pointer is swapped, and the CSV export (if any) is
+    # written to a temporary file and renamed over the old one, so the dashboard never reads
+    # a half-written version. Returns (rows written, failed locations).
+    written, failures = fetch_and_ingest(locations, api_key, root, **fetch_options)
+    if locations and len(failures) == len(locations):
+        raise RefreshError(f'all {len(locations)} locations failed, first error: {failures[0][1]!r}')
+    if csv_path:
+        export_csv(root, csv_path)
+    return written, failures
+
+
+def check_staleness(status, now, max_staleness=MAX_STALENESS_SECONDS):
+    # Alarm when the data hasn't been refreshed for too long; returns whether it is stale
+    last_success = status.get('last_success')
+    age = now - last_success if last_success is not None else None
+    stale = age is None or age > max_staleness
+    if stale:
+        since = f'{age / 60:.0f} minutes ago' if age is not None else 'never'
+        log.error('STALE: weather data last refreshed %s (limit %.0f minutes)', since, max_staleness / 60)
+    status['stale'] = stale
+    return stale
+
+
+def run(locations, api_key, root=STORE_PATH, csv_path=None, every_steps=1, delay=REFRESH_DELAY_SECONDS,
+        jitter=REFRESH_JITTER_SECONDS, max_staleness=MAX_STALENESS_SECONDS, once=False, **fetch_options):
+    # Refresh on the forecast cadence until stopped (or a single time with once=True).
+    # fetch_options go to fetcher.fetch_forecasts (url, max_attempts, ...).
+    cache = fetch_options.setdefault('cache', ResponseCache(CACHE_PATH))
+    status = read_status(root)
+    failures_in_row = 0
+
+    while True:
+        started = time.time()
+        try:
+            written, failures = refresh_once(locations, api_key, root, csv_path, **fetch_options)
+        except Exception as error:
+            failures_in_row += 1
+            status.update(last_error=repr(error), last_error_at=started, consecutive_failures=failures_in_row)
+            log.warning('Refresh failed (%d in a row): %r', failures_in_row, error)
+            next_run = time.time() + retry_delay(failures_in_row)
+        else:
+            failures_in_row = 0
+            status.update(last_success=started, rows_written=written, failed_locations=len(failures),
+                          consecutive_failures=0)
+            log.info('Refreshed %d locations: %d new or changed rows, %d failed',
+                     len(locations), written, len(failures))
+            next_run = next_refresh_time(time.time(), every_steps, delay, jitter)
+
+        # The cache lives across runs; report its hit ratio and bytes saved per run
+        if cache is not None:
+            report = cache.report()
+            log.info(format_report(report))
+            status['cache'] = report
+            cache.reset_stats()
+
+        check_staleness(status, time.time(), max_staleness)
+        status['next_run'] = next_run
+        write_status(root, status)
+        if once:
+            return status
+
+        log.info('Next refresh at %s', pd.Timestamp(next_run, unit='s', tz='UTC').strftime('%Y-%m-%d %H:%M:%S UTC'))
+        time.sleep(max(0.0, next_run - time.time()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the weather store on the 3-hour forecast cadence.')
+    parser.add_argument('locations', help='CSV with lat/lon columns')
+    parser.add_argument('--store', default=STORE_PATH, help='Parquet store to append to')
+    parser.add_argument('--csv', help='also publish a CSV export at this path after each refresh')
+    parser.add_argument('--every-steps', type=int, default=1, help='refresh every N forecast steps (3 hours each)')
+    parser.add_argument('--delay', type=float, default=REFRESH_DELAY_SECONDS,
+                        help='seconds after a forecast step to refresh')
+    parser.add_argument('--jitter', type=float, default=REFRESH_JITTER_SECONDS, help='maximum random extra delay')
+    parser.add_argument('--max-staleness', type=float, default=MAX_STALENESS_SECONDS,
+                        help='seconds without a successful refresh before the staleness alarm')
+    parser.add_argument('--once', action='store_true', help='refresh once and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    load_dotenv()
+    api_key = os.getenv("OPENWEATHER_API_KEY")
+    locations = list(pd.read_csv(args.locations)[['lat', 'lon']].itertuples(index=False, name=None))
+
+    status = run(locations, api_key, args.store, args.csv, args.every_steps, args.delay, args.jitter,
+                 args.max_staleness, args.once)
+    if args.once and status.get('stale'):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
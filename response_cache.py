@@ -0,0 +1,154 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import time
+import uuid
+
+# Default location of the on-disk response cache
+CACHE_PATH = '.forecast_cache'
+
+# Coordinates are rounded to 2 decimals (~1 km) so nearby requests share an entry
+COORD_DECIMALS = 2
+
+# The 5 day / 3 hour forecast is reissued every 3 hours, so entries expire at the next 3-hour boundary
+FORECAST_STEP_SECONDS = 3 * 3600
+
+# Least recently used entries are evicted once the cache grows past this size
+MAX_CACHE_BYTES = 500 * 1024 * 1024
+
+
+def next_forecast_step(timestamp):
+    # The first 3-hour UTC boundary (00:00, 03:00, ...) after timestamp
+    return (int(timestamp) // FORECAST_STEP_SECONDS + 1) * FORECAST_STEP_SECONDS
+
+
+class ResponseCache:
+    # One JSON file per (rounded lat, rounded lon, units) holding the body and its validators.
+    # A file's mtime is its last access time, which drives LRU eviction.
+
+    def __init__(self, root=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self.sizes = {
+            entry.path: entry.stat().st_size
+            for entry in os.scandir(root)
+            if entry.name.endswith('.json')
+        }
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'bytes_saved': 0}
+
+    def _path(self, lat, lon, units):
+        key = f'{round(float(lat), COORD_DECIMALS)}:{round(float(lon), COORD_DECIMALS)}:{units}'
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, entry):
+        # Write to a temporary file first so a reader never sees half an entry; the name is
+        # unique so processes writing the same entry don't collide
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, path)
+        self.sizes[path] = size
+        self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        total = sum(self.sizes.values())
+        if total <= self.max_bytes:
+            return
+        for path in sorted(self.sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0):
+            if total <= self.max_bytes:
+                break
+            total -= self.sizes.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, lat, lon, units, now=None):
+        # Returns (fresh body or None, conditional request headers for a stale entry)
+        path = self._path(lat, lon, units)
+        entry = self._read(path)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None, {}
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process just now; the entry read above is still good to use
+            pass
+        if (now or time.time()) < entry['expires_at']:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += entry['size']
+            return entry['body'], {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if not headers:
+            self.stats['misses'] += 1
+        return None, headers
+
+    def store(self, lat, lon, units, response, now=None):
+        # Save a 200 response with its ETag/Last-Modified validators
+        now = now or time.time()
+        entry = {
+            'body': response.json(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now,
+            'expires_at': next_forecast_step(now),
+            'size': len(response.content),
+        }
+        self._write(self._path(lat, lon, units), entry)
+        return entry['body']
+
+    def revalidated(self, lat, lon, units, now=None):
+        # The server answered 304 Not Modified: keep the cached body for another forecast step.
+        # Returns None (and counts a miss) when the entry was evicted or removed by another
+        # process since the lookup, so the caller fetches the body again.
+        path = self._path(lat, lon, units)
+        entry = self._read(path)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        now = now or time.time()
+        entry['fetched_at'] = now
+        entry['expires_at'] = next_forecast_step(now)
+        self._write(path, entry)
+        self.stats['revalidated'] += 1
+        self.stats['bytes_saved'] += entry['size']
+        return entry['body']
+
+    def record_miss(self):
+        # A conditional request came back with a new body
+        self.stats['misses'] += 1
+
+    def report(self):
+        # Hit ratio and bytes saved for this run (revalidations count as hits)
+        served = self.stats['hits'] + self.stats['revalidated']
+        total = served + self.stats['misses']
+        return {**self.stats, 'hit_ratio': served / total if total else 0.0}
+
+    def reset_stats(self):
+        # Start counting a new run (a long-lived cache reports each run on its own)
+        self.stats = dict.fromkeys(self.stats, 0)
+
+
+def format_report(report):
+    # One line for logs: "Cache hit ratio 75% (3 hits, 0 revalidated, 1 misses), 96.0 KiB saved"
+    return (f"Cache hit ratio {report['hit_ratio']:.0%} "
+            f"({report['hits']} hits, {report['revalidated']} revalidated, {report['misses']} misses), "
+            f"{report['bytes_saved'] / 1024:.1f} KiB saved")
@@ -0,0 +1,294 @@
+# spark_job.py
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from pyspark.sql import SparkSession, Window
+from pyspark.sql import functions as F
+from pyspark.sql.types import ArrayType, DoubleType, LongType, StringType, StructField, StructType
+
+from ingest import COUNTRY_NAMES, FORECAST_STEP_SECONDS
+from weather_store import (KEY_COLUMNS, PARTITION_SCHEMA, STORE_PATH, WEATHER_COLUMNS, move_staged,
+                           publish_store_version, update_derived_tables)
+
+# Spark schema of a raw /forecast response (only the fields we keep). Declaring doubles up
+# front means no convert_int_to_float_except_dt pass over the responses first.
+RESPONSE_SCHEMA = StructType([
+    StructField('list', ArrayType(StructType([
+        StructField('dt', LongType(), True),
+        StructField('main', StructType([
+            StructField('temp', DoubleType(), True),
+            StructField('feels_like', DoubleType(), True),
+            StructField('temp_min', DoubleType(), True),
+            StructField('temp_max', DoubleType(), True),
+            StructField('pressure', DoubleType(), True),
+            StructField('humidity', DoubleType(), True),
+        ]), True),
+        StructField('weather', ArrayType(StructType([
+            StructField('main', StringType(), True),
+            StructField('description', StringType(), True),
+        ])), True),
+        StructField('clouds', StructType([StructField('all', DoubleType(), True)]), True),
+        StructField('wind', StructType([
+            StructField('speed', DoubleType(), True),
+            StructField('deg', DoubleType(), True),
+        ]), True),
+        StructField('visibility', DoubleType(), True),
+        StructField('pop', DoubleType(), True),
+        StructField('rain', StructType([StructField('3h', DoubleType(), True)]), True),
+    ])), True),
+    StructField('city', StructType([
+        StructField('id', LongType(), True),
+        StructField('name', StringType(), True),
+        StructField('coord', StructType([
+            StructField('lat', DoubleType(), True),
+            StructField('lon', DoubleType(), True),
+        ]), True),
+        StructField('country', StringType(), True),
+        StructField('population', LongType(), True),
+        StructField('timezone', LongType(), True),
+        StructField('sunrise', LongType(), True),
+        StructField('sunset', LongType(), True),
+    ]), True),
+])
+
+# Core counts benchmarked by default (capped at the machine's cores)
+DEFAULT_CORES = [1, 2, 4, 8]
+
+
+def build_session(master='local[*]', timezone=None, app_name='PySpark Weather Job'):
+    builder = SparkSession.builder.appName(app_name).master(master)
+    if timezone:
+        # Time zone from_unixtime renders forecast/sunrise/sunset times in (as in the notebook)
+        builder = builder.config('spark.sql.session.timeZone', timezone)
+    return builder.getOrCreate()
+
+
+def read_responses(spark, path, multiline=False):
+    # Raw responses from a file, directory or glob: one response per line by default
+    # (saved responses and NDJSON archives, gzipped or not), multiline for pretty-printed files
+    return spark.read.schema(RESPONSE_SCHEMA).json(path, multiLine=multiline)
+
+
+def _wall_clock(seconds):
+    # Same as the notebook's from_unixtime, kept as a timestamp without time zone so the
+    # Parquet files hold the same wall-clock times as the rest of the store
+    return F.from_unixtime(seconds).cast('timestamp_ntz')
+
+
+def _issue_time(issued_at=None):
+    # Issue time of each response, as in ingest.py: the start of the 3-hour step before its
+    # first forecast, in UTC (or issued_at for every response, when given)
+    if issued_at is not None:
+        return F.lit(f'{pd.Timestamp(issued_at):%Y-%m-%d %H:%M:%S.%f}').cast('timestamp_ntz')
+    seconds = F.array_min(F.col('list.dt')) - F.lit(FORECAST_STEP_SECONDS)
+    return F.to_utc_timestamp(F.timestamp_seconds(seconds), F.current_timezone()).cast('timestamp_ntz')
+
+
+def flatten_responses(responses, issued_at=None):
+    # Flatten any number of responses into the store's rows. Each forecast row keeps only its
+    # city id and the per-response fields (the offset changes with DST, sunrise/sunset with the
+    # day); the static city metadata is a small table joined back by id with a broadcast hint,
+    # instead of the notebook's crossJoin against a one-city frame.
+    # Every response is a version of its rows, issued at its own time (see _issue_time);
+    # responses for a city overlap in forecast times, and each version is kept.
+    forecasts = responses.select(
+        F.monotonically_increasing_id().alias('response_order'),
+        _issue_time(issued_at).alias('issued_at'),
+        F.col('city.id').alias('city_id'),
+        F.col('city.timezone').alias('utc_offset'),
+        F.col('city.sunrise').alias('city_sunrise'),
+        F.col('city.sunset').alias('city_sunset'),
+        F.explode('list').alias('forecast'),
+    )
+    cities = responses.select(
+        F.col('city.id').alias('city_id'),
+        F.col('city.name').alias('city_name'),
+        F.col('city.country').alias('country_code'),
+        F.col('city.coord.lat').alias('city_latitude'),
+        F.col('city.coord.lon').alias('city_longitude'),
+        F.col('city.population').alias('population'),
+    ).dropDuplicates(['city_id'])
+    joined = forecasts.join(F.broadcast(cities), 'city_id')
+
+    # Replace country codes with full country names
+    country_names = F.create_map(*[F.lit(value) for pair in COUNTRY_NAMES.items() for value in pair])
+
+    df = joined.select(
+        _wall_clock(F.col('forecast.dt')).alias('forecast_time'),
+        F.col('forecast.main.temp').alias('temperature'),
+        F.col('forecast.main.feels_like').alias('feels_like_temperature'),
+        F.col('forecast.main.temp_min').alias('min_temperature'),
+        F.col('forecast.main.temp_max').alias('max_temperature'),
+        F.col('forecast.main.pressure').alias('pressure'),
+        F.col('forecast.main.humidity').alias('humidity'),
+        F.col('forecast.clouds.all').alias('cloudiness'),
+        F.col('forecast.wind.speed').alias('wind_speed'),
+        F.col('forecast.wind.deg').alias('wind_direction'),
+        F.col('forecast.visibility').alias('visibility'),
+        F.col('forecast.pop').alias('precipitation_probability'),
+        # Fill missing values for rain_volume (set to 0 if NULL)
+        F.coalesce(F.col('forecast.rain.3h'), F.lit(0.0)).alias('rain_volume'),
+        F.col('forecast.weather').getItem(0).getField('main').alias('weather_main'),
+        F.col('forecast.weather').getItem(0).getField('description').alias('weather_description'),
+        F.col('city_name'),
+        F.coalesce(country_names[F.col('country_code')], F.col('country_code')).alias('country'),
+        F.col('city_latitude'),
+        F.col('city_longitude'),
+        F.col('population'),
+        # Timezone as a UTC offset, e.g. "UTC+1"
+        F.concat(
+            F.lit('UTC'),
+            F.when(F.col('utc_offset') >= 0, F.lit('+')).otherwise(F.lit('-')),
+            (F.abs(F.col('utc_offset')) / 3600).cast('int'),
+        ).alias('timezone'),
+        _wall_clock(F.col('city_sunrise')).alias('sunrise'),
+        _wall_clock(F.col('city_sunset')).alias('sunset'),
+        F.col('issued_at'),
+        F.col('response_order'),
+    )
+
+    # Responses issued at the same time (e.g. the same one saved twice) carry one version of
+    # each row between them: the response read last wins, as in weather_store.unique_rows
+    latest_first = Window.partitionBy(*KEY_COLUMNS, 'issued_at').orderBy(F.col('response_order').desc())
+    df = df.withColumn('response_rank', F.row_number().over(latest_first)).where(F.col('response_rank') == 1)
+
+    return df.select(
+        *WEATHER_COLUMNS,
+        'issued_at',
+        F.date_format('forecast_time', 'yyyy-MM-dd').alias('forecast_date'),
+    )
+
+
+def write_partitioned(df, staging):
+    # Write one Parquet file per city/date partition, in parallel: rows are shuffled by
+    # partition first, so each task writes whole partitions instead of every task writing a
+    # small file into every partition (and nothing is funnelled through coalesce(1))
+    partition_columns = PARTITION_SCHEMA.names
+    df.repartition(*partition_columns).write.partitionBy(*partition_columns).parquet(staging)
+
+
+def run_job(spark, input_path, root=STORE_PATH, multiline=False, replace=False, issued_at=None):
+    # Flatten every response under input_path into the Parquet store. Spark writes to a hidden
+    # staging directory inside the store; the files are then renamed into their partitions
+    # and the store's version pointer is swapped last, as for any other ingest.
+    # Each response is issued at its own time unless issued_at is given for all of them.
+    # Returns {rows, partitions, spark_seconds, seconds}.
+    started = time.perf_counter()
+    df = flatten_responses(read_responses(spark, input_path, multiline), issued_at)
+
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.staging-{uuid.uuid4().hex}')
+    write_partitioned(df, staging)
+    spark_seconds = time.perf_counter() - started
+
+    # Count the rows from the written files rather than recomputing the whole job
+    rows = spark.read.parquet(staging).count()
+    partitions = move_staged(staging, root, replace)
+    if partitions:
+        update_derived_tables(root, pd.DataFrame(partitions, columns=PARTITION_SCHEMA.names))
+        publish_store_version(root)
+
+    return {'rows': rows, 'partitions': len(partitions), 'spark_seconds': spark_seconds,
+            'seconds': time.perf_counter() - started}
+
+
+def write_synthetic_responses(folder, count, files):
+    # Synthetic raw responses (see benchmark.py), split over several NDJSON files
+    from benchmark import synthetic_responses
+
+    responses = synthetic_responses(count)
+    per_file = -(-count // files)
+    for index in range(0, count, per_file):
+        with open(os.path.join(folder, f'responses-{index // per_file:04d}.ndjson'), 'w') as f:
+            for response in responses[index:index + per_file]:
+                f.write(json.dumps(response) + '\n')
+
+
+def benchmark_scaling(responses, cores_list, repeat=1):
+    # Throughput of the Spark stage (read, flatten, join, partitioned write) on 1..N cores.
+    # Linear scaling shows as a speedup close to the core count (efficiency close to 1).
+    # repeat: timed runs per core count (at least one), after an untimed warm-up run.
+    if repeat < 1:
+        raise ValueError(f'repeat must be at least 1, got {repeat}')
+    available = os.cpu_count() or 1
+    cores_list = [cores for cores in cores_list if cores <= available] or [available]
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        input_path = os.path.join(folder, 'responses')
+        os.makedirs(input_path)
+        write_synthetic_responses(input_path, responses, files=4 * max(cores_list))
+
+        for cores in cores_list:
+            # A fresh session per core count (SparkContext startup is not timed)
+            spark = build_session(f'local[{cores}]', app_name=f'Weather job benchmark ({cores} cores)')
+            best = None
+            for attempt in range(repeat + 1):
+                root = os.path.join(folder, f'store-{cores}-{attempt}')
+                result = run_job(spark, input_path, root)
+                shutil.rmtree(root)
+                # The first run warms up the JVM and is not counted
+                if attempt and (best is None or result['spark_seconds'] < best['spark_seconds']):
+                    best = result
+            spark.stop()
+
+            results.append({'cores': cores, 'responses': responses, 'rows': best['rows'],
+                            'spark_seconds': best['spark_seconds'],
+                            'rows_per_second': best['rows'] / best['spark_seconds']})
+
+    base = results[0]['rows_per_second'] / results[0]['cores']
+    for result in results:
+        result['speedup'] = result['rows_per_second'] / (base * results[0]['cores'])
+        result['efficiency'] = result['rows_per_second'] / (base * result['cores'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flatten raw /forecast responses for many cities into the '
+                                                 'partitioned Parquet store with Spark.')
+    parser.add_argument('input', nargs='?', help='file, directory or glob of raw responses')
+    parser.add_argument('--store', default=STORE_PATH, help='Parquet store to write to')
+    parser.add_argument('--master', default='local[*]', help='Spark master (default: %(default)s)')
+    parser.add_argument('--timezone', help='session time zone for forecast/sunrise/sunset times')
+    parser.add_argument('--multiline', action='store_true', help='responses are pretty-printed, one per file')
+    parser.add_argument('--replace', action='store_true',
+                        help='replace the partitions written instead of adding a new version')
+    parser.add_argument('--benchmark', action='store_true', help='measure throughput on 1..N cores instead')
+    parser.add_argument('--responses', type=int, default=2000, help='synthetic responses for --benchmark')
+    parser.add_argument('--cores', default=','.join(str(cores) for cores in DEFAULT_CORES),
+                        help='comma-separated core counts for --benchmark (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per core count, best kept')
+    parser.add_argument('--output', default='spark_bench_results.json', help='JSON results file for --benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        if args.repeat < 1:
+            parser.error('--repeat must be at least 1')
+        results = benchmark_scaling(args.responses, [int(cores) for cores in args.cores.split(',')], args.repeat)
+        for result in results:
+            print(f"{result['cores']:>3} cores  {result['rows_per_second']:>12,.0f} rows/s  "
+                  f"speedup {result['speedup']:.2f}  efficiency {result['efficiency']:.2f}")
+        with open(args.output, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'machine': platform.platform(),
+                       'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f'Wrote {args.output}')
+        return
+
+    if not args.input:
+        parser.error('input is required unless --benchmark is given')
+    spark = build_session(args.master, args.timezone)
+    result = run_job(spark, args.input, args.store, args.multiline, args.replace)
+    spark.stop()
+    print(f"Wrote {result['rows']} forecast rows in {result['partitions']} partitions to {args.store} "
+          f"({result['seconds']:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
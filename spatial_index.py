@@ -0,0 +1,207 @@
+# spatial_index.py
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_loader import expand_weather_frame
+
+# Stations are bucketed into a fixed lat/lon grid, so a viewport query only visits the
+# grid cells it overlaps instead of scanning every station
+GRID_CELL_DEGREES = 1.0
+GRID_ROWS = int(180 / GRID_CELL_DEGREES)
+GRID_COLUMNS = int(360 / GRID_CELL_DEGREES)
+
+# Size of the map in pixels, and of the clusters drawn on it: stations closer than
+# CLUSTER_PX on screen are merged into one marker, so a map never carries more than
+# (MAP_WIDTH_PX / CLUSTER_PX) x (MAP_HEIGHT_PX / CLUSTER_PX) markers however many stations there are
+MAP_WIDTH_PX = 700
+MAP_HEIGHT_PX = 400
+CLUSTER_PX = 40
+TILE_PX = 256
+
+# Values the station markers can be colored by: {label: (column, scale)}
+MAP_METRICS = {
+    'Temperature (°C)': ('temperature', 1),
+    'Precipitation probability (%)': ('precipitation_probability', 100),
+}
+
+# Station index of the latest data version, shared by every session: {data_version: StationIndex}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def mercator_pixels(lat, lon, zoom):
+    # Web Mercator pixel coordinates (as used by Mapbox) at the given zoom
+    scale = TILE_PX * 2.0 ** zoom
+    lat = np.clip(np.asarray(lat, dtype='float64'), -85.0511, 85.0511)
+    x = (np.asarray(lon, dtype='float64') + 180) / 360 * scale
+    y = (1 - np.log(np.tan(np.deg2rad(lat)) + 1 / np.cos(np.deg2rad(lat))) / np.pi) / 2 * scale
+    return x, y
+
+
+def mercator_coordinates(x, y, zoom):
+    # Inverse of mercator_pixels: (lat, lon) of pixel coordinates
+    scale = TILE_PX * 2.0 ** zoom
+    lon = np.asarray(x, dtype='float64') / scale * 360 - 180
+    lat = np.rad2deg(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y, dtype='float64') / scale))))
+    return lat, lon
+
+
+def viewport(lat, lon, zoom, width=MAP_WIDTH_PX, height=MAP_HEIGHT_PX):
+    # Bounds (south, north, west, east) of a map of width x height pixels centered on lat/lon.
+    # west > east when the view crosses the antimeridian; a view wider than the world is -180..180.
+    x, y = mercator_pixels(lat, lon, zoom)
+    north, west = mercator_coordinates(x - width / 2, y - height / 2, zoom)
+    south, east = mercator_coordinates(x + width / 2, y + height / 2, zoom)
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+    return float(south), float(north), float(west), float(east)
+
+
+def _unit_vectors(lat, lon):
+    # Points on the unit sphere: straight-line distance between them orders pairs the same
+    # way as great-circle distance, so a KD-tree over them finds the nearest station
+    lat = np.deg2rad(np.asarray(lat, dtype='float64'))
+    lon = np.deg2rad(np.asarray(lon, dtype='float64'))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _grid_cells(lat, lon):
+    rows = np.clip(((np.asarray(lat) + 90) // GRID_CELL_DEGREES).astype('int64'), 0, GRID_ROWS - 1)
+    columns = np.clip(((np.asarray(lon) + 180) // GRID_CELL_DEGREES).astype('int64'), 0, GRID_COLUMNS - 1)
+    return rows, columns
+
+
+class StationIndex:
+    # One row per station (city) of a TimeIndex, with a grid over their coordinates for
+    # viewport queries and a KD-tree for nearest-station lookups
+    def __init__(self, time_index):
+        self.time_index = time_index
+        df = time_index.df
+        names = list(time_index.cities)
+        self.starts = np.array([time_index.cities[name][0] for name in names], dtype='int64')
+        first_rows = expand_weather_frame(df[['city_latitude', 'city_longitude']].iloc[self.starts])
+        self.stations = pd.DataFrame({
+            'city_name': names,
+            'lat': first_rows['city_latitude'].to_numpy(dtype='float64'),
+            'lon': first_rows['city_longitude'].to_numpy(dtype='float64'),
+        })
+
+        # Grid: stations ordered by cell, so the stations of a run of cells are one slice
+        rows, columns = _grid_cells(self.stations['lat'], self.stations['lon'])
+        cells = rows * GRID_COLUMNS + columns
+        self.order = np.argsort(cells, kind='stable')
+        self.cells = cells[self.order]
+
+        # KD-tree when scipy is installed, otherwise nearest() scans the stations with NumPy
+        self.points = _unit_vectors(self.stations['lat'], self.stations['lon'])
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            self.tree = None
+        else:
+            self.tree = cKDTree(self.points)
+
+        # Conditions at the last time asked for: (time, frame)
+        self._current = None
+        self._current_lock = threading.Lock()
+
+    def in_viewport(self, south, north, west, east):
+        # Positions (into self.stations) of the stations inside the bounds, visiting only the
+        # grid cells the bounds overlap: two binary searches per grid row, all rows at once
+        row_start, column_start = _grid_cells(south, west)
+        row_end, column_end = _grid_cells(north, east)
+        if west <= east:
+            column_ranges = [(column_start, column_end)]
+        else:
+            column_ranges = [(column_start, GRID_COLUMNS - 1), (0, column_end)]
+
+        rows = np.arange(int(row_start), int(row_end) + 1) * GRID_COLUMNS
+        lo = np.concatenate([np.searchsorted(self.cells, rows + first, side='left') for first, _ in column_ranges])
+        hi = np.concatenate([np.searchsorted(self.cells, rows + last, side='right') for _, last in column_ranges])
+
+        # Gather the stations of all (lo, hi) runs at once
+        lengths = hi - lo
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(lo, lengths)
+        candidates = self.order[positions]
+
+        # Cells on the edge of the view are only partly inside it
+        lat = self.stations['lat'].to_numpy()[candidates]
+        lon = self.stations['lon'].to_numpy()[candidates]
+        inside = (lat >= south) & (lat <= north)
+        inside &= ((lon >= west) & (lon <= east)) if west <= east else ((lon >= west) | (lon <= east))
+        return np.sort(candidates[inside])
+
+    def nearest(self, lat, lon):
+        # Name of the station closest to a coordinate (great-circle distance)
+        point = _unit_vectors([lat], [lon])[0]
+        if self.tree is not None:
+            position = int(self.tree.query(point)[1])
+        else:
+            position = int(np.argmin(((self.points - point) ** 2).sum(axis=1)))
+        return self.stations['city_name'].iloc[position]
+
+    def current(self, now):
+        # Each station's forecast row for `now` (the latest one at or before it, or the first
+        # one when the forecast starts later), joined to the station table. One vectorized
+        # pass over the forecast times, kept until a different time is asked for.
+        now = pd.Timestamp(now)
+        with self._current_lock:
+            if self._current is not None and self._current[0] == now:
+                return self._current[1]
+
+        times = self.time_index.times
+        not_after = np.add.reduceat((times <= now.value).astype('int64'), self.starts) if len(times) else []
+        rows = np.maximum(self.starts + np.asarray(not_after, dtype='int64') - 1, self.starts)
+        columns = [column for column, _ in MAP_METRICS.values()]
+        values = expand_weather_frame(self.time_index.df[columns].iloc[rows]).reset_index(drop=True)
+        current = pd.concat([self.stations, values], axis=1)
+
+        with self._current_lock:
+            self._current = (now, current)
+        return current
+
+
+def get_station_index(time_index, data_version):
+    # The station index of this data version, built once and shared until new data lands
+    with _indexes_lock:
+        index = _indexes.get(data_version)
+        if index is None:
+            index = StationIndex(time_index)
+            _indexes.clear()
+            _indexes[data_version] = index
+    return index
+
+
+def cluster_stations(stations, zoom, metric, cluster_px=CLUSTER_PX):
+    # Merge stations that fall into the same cluster_px x cluster_px square on screen into
+    # one marker at their mean position, colored by their mean value. Returns one row per
+    # marker: lat, lon, value, count and city_name (the station's name, or "N stations").
+    column, scale = MAP_METRICS[metric]
+    if stations.empty:
+        return pd.DataFrame({'lat': [], 'lon': [], 'value': [], 'count': [], 'city_name': []})
+
+    x, y = mercator_pixels(stations['lat'], stations['lon'], zoom)
+    lat = stations['lat'].to_numpy(dtype='float64')
+    lon = stations['lon'].to_numpy(dtype='float64')
+    values = stations[column].to_numpy(dtype='float64') * scale
+
+    # Screen cell of each station, then per-cell counts and means with bincount
+    cells = (x // cluster_px).astype('int64') * (1 << 32) + (y // cluster_px).astype('int64')
+    _, first, inverse = np.unique(cells, return_index=True, return_inverse=True)
+    counts = np.bincount(inverse)
+    markers = pd.DataFrame({
+        'lat': np.bincount(inverse, lat) / counts,
+        'lon': np.bincount(inverse, lon) / counts,
+        'value': np.bincount(inverse, values) / counts,
+        'count': counts,
+        'city_name': stations['city_name'].to_numpy()[first],
+    })
+    clustered = markers['count'] > 1
+    markers.loc[clustered, 'city_name'] = markers.loc[clustered, 'count'].map('{} stations'.format)
+    return markers
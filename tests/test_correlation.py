@@ -0,0 +1,54 @@
+# test_correlation.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from correlation import CORRELATION_COLUMNS, correlation_matrix, daily_states
+from data_loader import DATA_PATH, read_weather_csv
+
+
+def two_cities():
+    # The recorded Ibadan forecast plus a second city with different (seeded) readings
+    ibadan = read_weather_csv(DATA_PATH)
+    lagos = ibadan.copy()
+    lagos['city_name'] = 'Lagos'
+    noise = np.random.default_rng(7).normal(size=(len(lagos), len(CORRELATION_COLUMNS)))
+    lagos[CORRELATION_COLUMNS] = lagos[CORRELATION_COLUMNS] + noise * lagos[CORRELATION_COLUMNS].std().to_numpy()
+    return pd.concat([ibadan, lagos], ignore_index=True)
+
+
+class CorrelationMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = two_cities()
+        self.states = daily_states(self.df)
+
+    def assertMatchesPandas(self, matrix, rows):
+        expected = rows[CORRELATION_COLUMNS].corr()
+        self.assertEqual(list(matrix.index), list(expected.index))
+        np.testing.assert_allclose(matrix.to_numpy(), expected.to_numpy(), rtol=0, atol=1e-12)
+
+    def test_whole_frame(self):
+        self.assertMatchesPandas(correlation_matrix(self.states), self.df)
+
+    def test_city_and_date_windows(self):
+        dates = self.df['forecast_time'].dt.normalize()
+        last = dates.max()
+        for city in ['Ibadan', 'Lagos']:
+            rows = self.df[self.df['city_name'] == city]
+            city_dates = dates[rows.index]
+            with self.subTest(city=city):
+                self.assertMatchesPandas(correlation_matrix(self.states, city), rows)
+            with self.subTest(city=city, last_days=3):
+                self.assertMatchesPandas(correlation_matrix(self.states, city, last_days=3),
+                                         rows[city_dates >= last - pd.Timedelta(days=2)])
+            start, end = '2024-09-16', '2024-09-18'
+            with self.subTest(city=city, start=start, end=end):
+                self.assertMatchesPandas(correlation_matrix(self.states, city, start=start, end=end),
+                                         rows[(city_dates >= start) & (city_dates <= end)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# test_data_loader.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+import data_loader
+from data_loader import load_cached_group
+
+
+class LoaderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, 'data.txt')
+        self.write('1')
+        data_loader.clear_cache()
+
+    def tearDown(self):
+        data_loader.clear_cache()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+        # A new mtime for every write, however fast the test runs
+        stamp = time.time_ns() + len(content) * 1_000_000_000
+        os.utime(self.path, ns=(stamp, stamp))
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('timed out')
+            time.sleep(0.01)
+
+    def test_group_switches_together_without_blocking(self):
+        release = threading.Event()
+        calls = []
+
+        def read_value(path):
+            with open(path) as f:
+                return pd.DataFrame({'value': [int(f.read())]})
+
+        def read_slow_double(path):
+            # The second reader of the group blocks until released, like a slow table
+            calls.append(path)
+            if len(calls) > 1:
+                release.wait(5)
+            return read_value(path) * 2
+
+        readers = [read_value, read_slow_double]
+        _, (value, double) = load_cached_group(self.path, readers)
+        self.assertEqual((value['value'][0], double['value'][0]), (1, 2))
+
+        self.write('22')
+        started = time.monotonic()
+        _, (value, double) = load_cached_group(self.path, readers)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((value['value'][0], double['value'][0]), (1, 2))
+
+        # Until the whole group is read, the old version of every frame is served
+        release.set()
+        self.wait_for(lambda: load_cached_group(self.path, readers)[1][0]['value'][0] == 22)
+        _, (value, double) = load_cached_group(self.path, readers)
+        self.assertEqual(double['value'][0], 44)
+
+    def test_failed_reload_backs_off(self):
+        calls = []
+
+        def read_number(path):
+            calls.append(path)
+            with open(path) as f:
+                return pd.DataFrame({'value': [int(f.read())]})
+
+        load_cached_group(self.path, [read_number])
+        failures = data_loader.get_loader_stats()['reload_failures']
+
+        self.write('not a number')
+        load_cached_group(self.path, [read_number])
+        self.wait_for(lambda: data_loader.get_loader_stats()['reload_failures'] == failures + 1)
+        self.wait_for(lambda: not data_loader._reloading)
+
+        # The unreadable version is not read again on every call, and the old frame stays served
+        for _ in range(5):
+            _, [frame] = load_cached_group(self.path, [read_number])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(frame['value'][0], 1)
+
+        # A new version is tried straight away
+        self.write('333')
+        load_cached_group(self.path, [read_number])
+        self.wait_for(lambda: load_cached_group(self.path, [read_number])[1][0]['value'][0] == 333)
+
+
+class SharedFrameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.cache_path = data_loader.FRAME_CACHE_PATH
+        self.frame_format = data_loader.FRAME_FORMAT
+        data_loader.FRAME_CACHE_PATH = os.path.join(self.workdir, 'frame_cache')
+
+    def tearDown(self):
+        data_loader.FRAME_CACHE_PATH = self.cache_path
+        data_loader.FRAME_FORMAT = self.frame_format
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_frame_of_another_format_is_not_mapped(self):
+        # A frame cached by older code (here: one without the derived metric columns) is
+        # rebuilt by code with a newer frame format, and the old file is removed
+        data_loader.FRAME_FORMAT = 0
+        old_path = data_loader.shared_frame_path(data_loader.DATA_PATH, data_loader.data_version())
+        os.makedirs(data_loader.FRAME_CACHE_PATH)
+        data_loader.write_arrow_frame(data_loader.read_weather_csv(), old_path)
+
+        data_loader.FRAME_FORMAT = self.frame_format
+        df = data_loader.read_weather_data()
+        self.assertIn('heat_index', df)
+        self.assertEqual(os.listdir(data_loader.FRAME_CACHE_PATH),
+                         [os.path.basename(data_loader.shared_frame_path(data_loader.DATA_PATH,
+                                                                         data_loader.data_version()))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# test_downsample.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from charts import humidity_area_figure, temperature_range_figure
+from downsample import minmax_indices
+
+
+class MinMaxIndicesTest(unittest.TestCase):
+
+    def test_keeps_each_bucket_extremes(self):
+        values = np.sin(np.linspace(0, 20, 1000))
+        indices = minmax_indices(values, max_points=100)
+        self.assertLessEqual(len(indices), 100)
+        self.assertIn(int(np.argmax(values)), indices)
+        self.assertIn(int(np.argmin(values)), indices)
+
+    def test_all_missing_buckets_are_skipped(self):
+        # A stretch with no readings of one series keeps the other series' extremes there,
+        # and a stretch with no readings at all keeps one row, so the gap is still drawn
+        high = np.linspace(20, 30, 1000)
+        low = high - 5
+        high[100:300] = np.nan
+        low[100:500] = np.nan
+
+        indices = minmax_indices(high, low, max_points=100)
+        gap = indices[(indices >= 100) & (indices < 300)]
+        self.assertEqual(len(gap), len(range(100, 300, 20)))
+        self.assertTrue(np.isnan(high[gap]).all())
+        self.assertFalse(np.isnan(high[indices[(indices >= 300) & (indices < 500)]]).any())
+
+    def test_area_charts_draw_a_stretch_of_missing_readings(self):
+        df = pd.DataFrame({
+            'forecast_time': pd.date_range('2024-09-15', periods=2000, freq='h'),
+            'humidity': np.linspace(40, 90, 2000),
+            'max_temperature': np.linspace(25, 35, 2000),
+            'min_temperature': np.linspace(20, 30, 2000),
+            'date': '15 Sep',
+        })
+        df.loc[300:700, ['humidity', 'max_temperature', 'min_temperature']] = np.nan
+
+        humidity_area_figure(df, max_points=200)
+        temperature_range_figure(df, max_points=200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+# test_fetcher.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import asyncio
+import copy
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from fetcher import RateLimiter, fetch_and_ingest, fetch_forecast, fetch_forecasts
+from response_cache import ResponseCache
+from weather_store import read_weather_store
+
+# A /forecast response recorded for Ibadan (lat=7.42&lon=3.93), the notebook's location
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'forecast_ibadan.json')
+with open(FIXTURE_PATH) as f:
+    RECORDED_FORECAST = json.load(f)
+
+
+def recorded_forecast(lat, lon):
+    # The recorded payload moved to (lat, lon), with a city name of its own per location
+    data = copy.deepcopy(RECORDED_FORECAST)
+    data['city']['name'] = f'Station {lat},{lon}'
+    data['city']['coord'] = {'lat': float(lat), 'lon': float(lon)}
+    return data
+
+
+class StubForecastServer:
+    # Local stand-in for api.openweathermap.org/data/2.5/forecast. By default every request
+    # gets the recorded payload with an ETag; tests queue (status, headers) answers in
+    # `script` to make the next requests fail, and `delay` slows every response down.
+    ETAG = '"recorded-forecast"'
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.script = []
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/data/2.5/forecast'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request):
+        with self.lock:
+            self.requests.append((time.monotonic(), dict(request.headers)))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            answer = self.script.pop(0) if self.script else None
+        try:
+            time.sleep(self.delay)
+            query = parse_qs(urlparse(request.path).query)
+            if answer is not None:
+                status, headers = answer
+                body = b''
+            elif request.headers.get('If-None-Match') == self.ETAG:
+                status, headers, body = 304, {'ETag': self.ETAG}, b''
+            else:
+                status, headers = 200, {'ETag': self.ETAG, 'Content-Type': 'application/json'}
+                body = json.dumps(recorded_forecast(query['lat'][0], query['lon'][0])).encode()
+
+            request.send_response(status)
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+async def fetch_with_limiter(url, limiter, locations, **options):
+    # fetch_forecast over one client, every location at once, sharing the given limiter
+    async with httpx.AsyncClient() as client:
+        return await asyncio.gather(
+            *(fetch_forecast(client, limiter, lat, lon, 'test-key', url=url, **options) for lat, lon in locations),
+            return_exceptions=True,
+        )
+
+
+class FetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_concurrency_is_capped(self):
+        locations = [(7.0 + i, 3.0) for i in range(12)]
+        with StubForecastServer(delay=0.1) as stub:
+            responses = asyncio.run(fetch_forecasts(locations, 'test-key', url=stub.url, max_concurrency=3,
+                                                    requests_per_minute=1000))
+        self.assertEqual(len(stub.requests), 12)
+        self.assertEqual(stub.max_in_flight, 3)
+        self.assertEqual([r['city']['coord']['lat'] for r in responses], [lat for lat, _ in locations])
+
+    def test_server_error_is_retried(self):
+        with StubForecastServer() as stub:
+            stub.script = [(503, {})]
+            [response] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'test-key', url=stub.url))
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(response['city']['name'], 'Station 7.42,3.93')
+
+    def test_unauthorized_is_not_retried(self):
+        with StubForecastServer() as stub:
+            stub.script = [(401, {})]
+            [response] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'bad-key', url=stub.url))
+        self.assertEqual(len(stub.requests), 1)
+        self.assertIsInstance(response, httpx.HTTPStatusError)
+        self.assertEqual(response.response.status_code, 401)
+
+    def test_requests_are_paced(self):
+        # At most 5 requests in any 0.5 s window, however many are waiting (arrival times
+        # at the stub jitter a little with connection setup, hence the tolerance)
+        period = 0.5
+        with StubForecastServer() as stub:
+            limiter = RateLimiter(5, period=period)
+            started = time.monotonic()
+            responses = asyncio.run(fetch_with_limiter(stub.url, limiter, [(7.0 + i, 3.0) for i in range(12)]))
+        self.assertFalse([r for r in responses if isinstance(r, Exception)])
+        times = sorted(sent for sent, _ in stub.requests)
+        self.assertEqual(len(times), 12)
+        for first, sixth in zip(times, times[5:]):
+            self.assertGreater(sixth - first, period * 0.7)
+        # The 11th and 12th requests have to wait for two full windows
+        self.assertGreaterEqual(times[-1] - started, 2 * period)
+
+    def test_retry_after_is_honored(self):
+        # A 429 with Retry-After holds back the retry (and every other sender) that long,
+        # instead of the generic backoff
+        with StubForecastServer() as stub:
+            stub.script = [(429, {'Retry-After': '1'})]
+            limiter = RateLimiter(1000)
+            responses = asyncio.run(fetch_with_limiter(stub.url, limiter, [(7.42, 3.93)]))
+        self.assertEqual(responses[0]['city']['name'], 'Station 7.42,3.93')
+        (first, _), (retry, _) = stub.requests
+        self.assertGreaterEqual(retry - first, 0.95)
+        self.assertLess(retry - first, 1.5)
+
+    def expire_entry(self, cache, lat, lon):
+        # Make a cached entry stale, so the next fetch sends its ETag and gets a 304
+        path = cache._path(lat, lon, 'metric')
+        with open(path) as f:
+            entry = json.load(f)
+        entry['expires_at'] = 0
+        with open(path, 'w') as f:
+            json.dump(entry, f)
+
+    def test_stale_cache_entry_is_revalidated(self):
+        cache = ResponseCache(os.path.join(self.workdir, 'cache'))
+        with StubForecastServer() as stub:
+            [first] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'test-key', url=stub.url, cache=cache))
+            self.expire_entry(cache, 7.42, 3.93)
+            [second] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'test-key', url=stub.url, cache=cache))
+
+        self.assertEqual(second, first)
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(stub.requests[1][1].get('If-None-Match'), StubForecastServer.ETAG)
+        report = cache.report()
+        self.assertEqual((report['misses'], report['revalidated']), (1, 1))
+        self.assertGreater(report['bytes_saved'], 0)
+
+    def test_entry_removed_before_revalidation_is_fetched_again(self):
+        # Another process evicts the entry between the lookup and the 304: the body is
+        # fetched again without validators instead of failing
+        class EvictedCache(ResponseCache):
+            def lookup(self, lat, lon, units, now=None):
+                result = super().lookup(lat, lon, units, now)
+                os.remove(self._path(lat, lon, units))
+                return result
+
+        cache = EvictedCache(os.path.join(self.workdir, 'cache'))
+        with StubForecastServer() as stub:
+            [first] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'test-key', url=stub.url,
+                                                  cache=ResponseCache(cache.root)))
+            self.expire_entry(cache, 7.42, 3.93)
+            [second] = asyncio.run(fetch_forecasts([(7.42, 3.93)], 'test-key', url=stub.url, cache=cache))
+
+        self.assertEqual(second, first)
+        self.assertEqual([headers.get('If-None-Match') for _, headers in stub.requests],
+                         [None, StubForecastServer.ETAG, None])
+        self.assertEqual((cache.report()['misses'], cache.report()['revalidated']), (1, 0))
+
+    def test_fetch_and_ingest_writes_store(self):
+        root = os.path.join(self.workdir, 'store')
+        locations = [(7.42, 3.93), (6.52, 3.38), (9.06, 7.49)]
+        with StubForecastServer() as stub:
+            written, failures = fetch_and_ingest(locations, 'test-key', root, url=stub.url)
+            self.assertEqual((written, failures), (3 * 40, []))
+
+            df = read_weather_store(root)
+            self.assertEqual(len(df), 3 * 40)
+            self.assertEqual(sorted(df['city_name'].unique()), sorted(f'Station {lat},{lon}' for lat, lon in locations))
+
+            # Nothing changed, so a second run adds nothing
+            written, failures = fetch_and_ingest(locations, 'test-key', root, url=stub.url)
+            self.assertEqual((written, failures), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+# test_flatten.py
+# Run from the repository root: python -m pytest tests
+import json
+import os
+import unittest
+
+import pytest
+
+from data_loader import WEATHER_DTYPES, read_weather_csv
+from ingest import flatten_forecast
+from weather_store import WEATHER_COLUMNS
+
+# The recorded Ibadan response and the CSV the notebook flattened it to (with the session
+# time zone set to Africa/Lagos, as in main.ipynb)
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'forecast_ibadan.json')
+CSV_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'transformed_weather_data.csv')
+TIMEZONE = 'Africa/Lagos'
+
+
+class FlattenParityTest(unittest.TestCase):
+
+    def test_pandas_flatten_matches_notebook_csv(self):
+        with open(FIXTURE_PATH) as f:
+            response = json.load(f)
+        flat = flatten_forecast(response, timezone=TIMEZONE)
+        expected = read_weather_csv(CSV_PATH)
+        self.assertTrue(flat.equals(expected), flat.compare(expected) if flat.shape == expected.shape else flat.shape)
+
+
+class SparkParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        pytest.importorskip('pyspark')
+        from spark_job import build_session
+        try:
+            cls.spark = build_session('local[1]', TIMEZONE, app_name='Weather flatten parity test')
+        except Exception as error:
+            # pyspark without a Java runtime to start it
+            raise unittest.SkipTest(f'Spark session could not start: {error}')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.spark.stop()
+
+    def test_spark_flatten_matches_notebook_csv(self):
+        from spark_job import flatten_responses, read_responses
+
+        responses = read_responses(self.spark, FIXTURE_PATH, multiline=True)
+        flat = flatten_responses(responses).toPandas()
+        flat = flat[WEATHER_COLUMNS].sort_values('forecast_time', ignore_index=True).astype(WEATHER_DTYPES)
+        expected = read_weather_csv(CSV_PATH)
+        self.assertTrue(flat.equals(expected), flat.compare(expected) if flat.shape == expected.shape else flat.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# test_ingest.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ingest import ingest_ndjson
+from weather_store import read_weather_store
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'forecast_ibadan.json')
+with open(FIXTURE_PATH) as f:
+    RECORDED_FORECAST = json.load(f)
+
+
+def later_forecast(data, steps, warmer):
+    # The response fetched `steps` 3-hour steps later: the list moves on, and the forecasts
+    # it still shares with the earlier response have been revised
+    data = copy.deepcopy(data)
+    for entry in data['list']:
+        entry['dt'] += steps * 3 * 3600
+        entry['main']['temp'] += warmer
+    return data
+
+
+class IngestArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.workdir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def write_archive(self, responses):
+        path = os.path.join(self.workdir, 'responses.ndjson')
+        with open(path, 'w') as f:
+            for response in responses:
+                f.write(json.dumps(response) + '\n')
+        return path
+
+    def test_overlapping_responses_are_kept_as_versions(self):
+        first, second = RECORDED_FORECAST, later_forecast(RECORDED_FORECAST, 1, 1.0)
+        other_city = copy.deepcopy(RECORDED_FORECAST)
+        other_city['city']['name'] = 'Lagos'
+        archive = self.write_archive([first, other_city, second])
+
+        for batch_lines in (1000, 1):
+            with self.subTest(batch_lines=batch_lines):
+                shutil.rmtree(self.root, ignore_errors=True)
+                self.assertEqual(ingest_ndjson(archive, self.root, batch_lines=batch_lines), 3 * 40)
+
+                history = read_weather_store(self.root, city='Ibadan', history=True)
+                self.assertEqual(len(history), 80)
+                self.assertEqual(history['issued_at'].nunique(), 2)
+
+                # The latest read has the later response's forecasts, plus the first
+                # response's earliest one that the later response no longer covers
+                latest = read_weather_store(self.root, city='Ibadan')
+                self.assertEqual(len(latest), 41)
+                self.assertEqual(latest['temperature'].iloc[0], first['list'][0]['main']['temp'])
+                self.assertEqual(latest['temperature'].iloc[1:].tolist(),
+                                 [entry['main']['temp'] for entry in second['list']])
+
+                # Ingesting the same archive again adds nothing
+                self.assertEqual(ingest_ndjson(archive, self.root, batch_lines=batch_lines), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# test_weather_store.py
+# Run from the repository root: python -m pytest tests  (or python -m unittest discover tests)
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from daily_summary import load_daily_summary
+from data_loader import DATA_PATH, clear_cache, read_weather_csv
+from weather_store import KEY_COLUMNS, append_weather_store, read_weather_store, write_weather_store
+
+
+class WeatherStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.workdir, 'store')
+        self.df = read_weather_csv(DATA_PATH)
+        clear_cache()
+
+    def tearDown(self):
+        clear_cache()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def test_append_in_the_same_second_is_a_new_version(self):
+        # A write and an append within one second keep both versions, and the latest read,
+        # like the daily summary, returns the appended values
+        write_weather_store(self.df, self.root)
+        changed = self.df.copy()
+        changed.loc[:9, 'temperature'] += 5
+        self.assertEqual(append_weather_store(changed, self.root), 10)
+
+        self.assertEqual(len(read_weather_store(self.root, history=True)), len(self.df) + 10)
+        latest = read_weather_store(self.root).sort_values(KEY_COLUMNS, ignore_index=True)
+        expected = changed.sort_values(KEY_COLUMNS, ignore_index=True)
+        self.assertEqual(latest['temperature'].tolist(), expected['temperature'].tolist())
+
+        _, summary = load_daily_summary(self.root)
+        first_day = changed['forecast_time'].dt.strftime('%Y-%m-%d') == summary.index[0][1]
+        self.assertEqual(summary['max_temperature'].iloc[0], changed.loc[first_day, 'temperature'].max())
+
+    def test_versions_issued_at_the_same_time_resolve_the_same_everywhere(self):
+        issued_at = pd.Timestamp('2024-09-15 10:00:00')
+        write_weather_store(self.df, self.root, issued_at=issued_at)
+        for delta in (7, 3):
+            changed = self.df.copy()
+            changed['temperature'] += delta
+            append_weather_store(changed, self.root, issued_at=issued_at)
+
+        self.assertEqual(len(read_weather_store(self.root, history=True)), 3 * len(self.df))
+        latest = read_weather_store(self.root)
+        winner = latest['temperature'] - self.df['temperature']
+        self.assertEqual(winner.round(6).unique().tolist(), [7])
+
+        _, summary = load_daily_summary(self.root)
+        first_day = self.df['forecast_time'].dt.strftime('%Y-%m-%d') == summary.index[0][1]
+        self.assertEqual(summary['max_temperature'].iloc[0], self.df.loc[first_day, 'temperature'].max() + 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
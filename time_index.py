@@ -0,0 +1,121 @@
+# time_index.py
+import threading
+
+import numpy as np
+import pandas as pd
+
+from downsample import CHART_WIDTH_PX
+
+# Server-side rollups for ranges too wide to plot raw: {label: pandas frequency}
+ROLLUPS = {'Raw': None, 'Hourly': '1h', '3-hourly': '3h', 'Daily': '1D'}
+
+# "Auto" plots raw rows up to this many points, then the finest rollup that fits
+MAX_RAW_POINTS = 2 * CHART_WIDTH_PX
+
+# How each column is rolled up; anything not listed keeps its first value in the bucket.
+# Wind direction keeps its first value too: the arithmetic mean of angles is meaningless.
+ROLLUP_AGGREGATES = {
+    'temperature': 'mean',
+    'feels_like_temperature': 'mean',
+    'min_temperature': 'min',
+    'max_temperature': 'max',
+    'pressure': 'mean',
+    'humidity': 'mean',
+    'cloudiness': 'mean',
+    'wind_speed': 'mean',
+    'visibility': 'mean',
+    'precipitation_probability': 'mean',
+    'rain_volume': 'sum',
+    'dew_point': 'mean',
+    'heat_index': 'mean',
+}
+
+# Index of the latest data version, shared by every session: {data_version: TimeIndex}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def sort_weather_frame(df):
+    # Rows ordered by (city, forecast_time), the order TimeIndex relies on
+    return df.sort_values(['city_name', 'forecast_time'], kind='stable', ignore_index=True)
+
+
+class TimeIndex:
+    # Row boundaries of each city in a frame sorted by (city, forecast_time), and the
+    # forecast times as int64, so a city/time range is two binary searches and a slice
+    def __init__(self, df):
+        self.df = df
+        # Nanoseconds whatever the column's unit (the Parquet store loads seconds)
+        self.times = df['forecast_time'].to_numpy().astype('datetime64[ns]', copy=False).view('int64')
+
+        cities = df['city_name'].to_numpy()
+        starts = np.flatnonzero(cities[1:] != cities[:-1]) + 1
+        bounds = np.concatenate([[0], starts, [len(df)]])
+        self.cities = {cities[start]: (start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start}
+
+    def city_names(self):
+        return sorted(self.cities)
+
+    def time_bounds(self, city):
+        # First and last forecast time of a city
+        start, end = self.cities[city]
+        return pd.Timestamp(self.times[start]), pd.Timestamp(self.times[end - 1])
+
+    def city_row(self, city):
+        # First row of a city, for its per-city attributes (country, coordinates, ...)
+        return self.df.iloc[self.cities[city][0]]
+
+    def range(self, city, start=None, end=None):
+        # Rows of one city with start <= forecast_time <= end (both optional), as a slice
+        # of the shared frame; O(log n) however much history there is
+        if city not in self.cities:
+            return self.df.iloc[0:0]
+        lo, hi = self.cities[city]
+        times = self.times[lo:hi]
+        if start is not None:
+            lo_offset = np.searchsorted(times, pd.Timestamp(start).value, side='left')
+        else:
+            lo_offset = 0
+        if end is not None:
+            hi_offset = np.searchsorted(times, pd.Timestamp(end).value, side='right')
+        else:
+            hi_offset = len(times)
+        return self.df.iloc[lo + lo_offset:lo + hi_offset]
+
+
+def get_time_index(df, data_version):
+    # The index of this data version, built once and shared until new data lands
+    with _indexes_lock:
+        index = _indexes.get(data_version)
+        if index is None:
+            index = TimeIndex(df)
+            _indexes.clear()
+            _indexes[data_version] = index
+    return index
+
+
+def auto_rollup(rows, start, end):
+    # Raw rows when they fit the chart width, otherwise the finest rollup that does
+    if rows <= MAX_RAW_POINTS:
+        return 'Raw'
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for label, freq in ROLLUPS.items():
+        if freq is not None and span / pd.Timedelta(freq) <= MAX_RAW_POINTS:
+            return label
+    return 'Daily'
+
+
+def rollup(df, label):
+    # Aggregate the rows into time buckets of the given rollup (empty buckets are dropped)
+    freq = ROLLUPS[label]
+    if freq is None or df.empty:
+        return df
+    aggregates = {column: ROLLUP_AGGREGATES.get(column, 'first')
+                  for column in df.columns if column not in ('forecast_time', 'date')}
+    grouped = df.groupby(pd.Grouper(key='forecast_time', freq=freq))
+    rolled = grouped.agg(aggregates)
+    rolled = rolled[grouped.size() > 0].reset_index()
+
+    # Day labels for the bar charts, as at load time
+    rolled['date'] = rolled['forecast_time'].dt.strftime('%d %b')
+    return rolled[[column for column in df.columns if column in rolled]]
@@ -1,510 +1,406 @@
 # weather_app.py
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
-import plotly.figure_factory as ff
-import numpy as np
 from dotenv import load_dotenv
 import os
 
+import charts
+from correlation import correlation_matrix, states_reader
+from daily_summary import city_daily_summary, lookup_daily_summary, summary_reader
+from data_loader import DATA_PATH, expand_weather_frame, load_cached_group, read_weather_data
+from figure_cache import cached_figure
+from metrics import DEBUG_PANEL_ENABLED, RerunTimer, record_frame_memory
+from spatial_index import MAP_METRICS, cluster_stations, get_station_index, viewport
+from time_index import ROLLUPS, auto_rollup, get_time_index, rollup
+from weather_store import STORE_PATH
+
 # Load the environment variables from the .env file
 load_dotenv()
 
-# Load the processed weather data
-df_daily = pd.read_csv('transformed_weather_data.csv', parse_dates=['forecast_time'])
+# City shown on first load, and surveyed coordinates that override the forecast's rounded ones
+DEFAULT_CITY = 'Ibadan'
+CITY_COORDINATES = {'Ibadan': (7.3775, 3.9470)}
+
+# Per-section timings of this rerun (only collected when metrics or the debug panel are enabled)
+timer = RerunTimer()
+
+# Prefer the partitioned Parquet store; fall back to the CSV export if it hasn't been built
+use_store = os.path.isdir(STORE_PATH)
+
+with timer.span('load'):
+    # Load the processed weather data: a read-only view of the memory-mapped frame shared by
+    # every session (and process) until the data changes. forecast_time is already a datetime
+    # and the '23 Aug' date labels are derived at load time, so sessions never modify it.
+    # Figures and indexes are cached per data version, so they are only rebuilt when new data
+    # lands. The version comes with the frame from one read of the loader cache, so a reload
+    # finishing mid-rerun can't put the old frame under the new version's key.
+    # Loaded in the same group: per-city, per-day aggregates for the "Weather Overview" tiles,
+    # precomputed at ingest, and per-city, per-day moment states for the correlation heatmap,
+    # maintained at ingest. A new version of all three is read in one background thread and
+    # published at once, so tiles, heatmap and charts switch in the same rerun.
+    data_source = STORE_PATH if use_store else DATA_PATH
+    data_version, (df_daily, daily_summary, correlation_states) = load_cached_group(
+        data_source, [read_weather_data, summary_reader(data_source), states_reader(data_source)])
+
+# Frame memory gauge (measured once per data version)
+record_frame_memory(data_version, df_daily)
+
+# Set page title and description
+st.set_page_config(page_title="Ibadan Weather Dashboard", layout="wide")
+
+# Rows are sorted by (city, forecast_time); the index answers city/date-range queries with
+# binary searches instead of full-frame masks, and is built once per data version
+time_index = get_time_index(df_daily, data_version)
+
+# Station coordinates on a grid (viewport queries) and a KD-tree (nearest station), built once
+# per data version
+station_index = get_station_index(time_index, data_version)
+
+# City selector (Ibadan by default). Its value lives in the session state, so clicking the map
+# or looking up the nearest station can select a city too.
+cities = time_index.city_names()
+if st.session_state.get('city') not in cities:
+    st.session_state['city'] = DEFAULT_CITY if DEFAULT_CITY in cities else cities[0]
+city_name = st.sidebar.selectbox("City", cities, key='city')
+city_row = time_index.city_row(city_name)
+
+
+def select_nearest_station(lat, lon):
+    # Make the station nearest to a coordinate the selected city
+    st.session_state['city'] = station_index.nearest(lat, lon)
+
+
+def select_clicked_station():
+    # A click on a station or cluster marker selects the station nearest to it; the map's
+    # section then reruns the whole dashboard for the new city
+    points = st.session_state['station_map'].selection.points
+    if points:
+        point = points[0]
+        select_nearest_station(*point.get('customdata') or (point['lat'], point['lon']))
+        st.session_state['station_clicked'] = True
+
+
+def select_typed_station():
+    select_nearest_station(st.session_state['nearest_lat'], st.session_state['nearest_lon'])
+
 
-# Set the latitude and longitude of Ibadan, Nigeria
-ibadan_lat = 7.3775
-ibadan_lon = 3.9470
+# Nearest station to a typed-in coordinate
+with st.sidebar.expander("📍 Nearest station"):
+    st.number_input("Latitude", -90.0, 90.0, float(city_row['city_latitude']), format="%.4f", key='nearest_lat')
+    st.number_input("Longitude", -180.0, 180.0, float(city_row['city_longitude']), format="%.4f", key='nearest_lon')
+    st.button("Select nearest station", on_click=select_typed_station)
 
-# Filter the data to get the current day's forecast
+# Set the latitude and longitude of the city (surveyed coordinates for Ibadan, Nigeria;
+# the forecast's city coordinates elsewhere)
+city_lat, city_lon = CITY_COORDINATES.get(
+    city_name, (round(float(city_row['city_latitude']), 4), round(float(city_row['city_longitude']), 4))
+)
+
+# Look up the current day's tiles (a single indexed lookup, no scan over the forecast rows)
 today = datetime.today().date()  # Get the current date
-df_today = df_daily[df_daily['forecast_time'].dt.date == today]
+with timer.span('today_filter'):
+    today_summary = lookup_daily_summary(daily_summary, city_name, today)
 
 # Format today's date as "22 AUG 2024" (sample look)
 formatted_today = today.strftime("%d %b %Y").upper()
 
-# Set page title and description
-st.set_page_config(page_title="Ibadan Weather Dashboard", layout="wide")
-
 # Create a centered title with a sunny yellow color
 st.markdown(
-    """
-    <h1 style="text-align: center; color: #FFD700;">Ibadan, Nigeria Weather Forecast Dashboard</h1>
+    f"""
+    <h1 style="text-align: center; color: #FFD700;">{city_name}, {city_row['country']} Weather Forecast Dashboard</h1>
     """,
     unsafe_allow_html=True
 )
 
-# If there's no data for today, display a message
-if df_today.empty:
-    st.error("No weather data available for today.")
-else:
-    st.markdown(
-    f"""
-    <h3 style="color: #2ca02c;">Weather Overview for {formatted_today}</h3>
-    """, 
-    unsafe_allow_html=True
+# Date range of the charts (the city's whole forecast by default). Wide ranges are rolled
+# up server-side and downsampled to about one point per pixel; narrow ones plot every row.
+first_time, last_time = time_index.time_bounds(city_name)
+date_range = st.sidebar.date_input(
+    "Date range",
+    value=(first_time.date(), last_time.date()),
+    min_value=first_time.date(),
+    max_value=last_time.date(),
+    format="DD/MM/YYYY",
 )
-    #st.write(f"### Weather Overview for {formatted_today}")
-    
-    # Set up a four-column layout for today's key weather metrics
-    col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
-    
-    with col1:
-        max_temp = df_today['temperature'].max()
-        st.metric(label="🌡️ Max Temperature", value=f"{max_temp:.2f}°C")
-    
-    with col2:
-        min_temp = df_today['temperature'].min()
-        st.metric(label="🌡️ Min Temperature", value=f"{min_temp:.2f}°C")
-    
-    with col3:
-        total_precip = df_today['precipitation_probability'].sum()
-        st.metric(label="🌧️ Total Precipitation", value=f"{total_precip:.2f} mm")
-    
-    with col4:
-        max_wind = df_today['wind_speed'].max()
-        st.metric(label="🌬️ Max Wind Speed", value=f"{max_wind:.2f} m/s")
-    
-    with col5:
-        # Convert 'sunrise' to datetime and format it to 12-hour time (AM/PM)
-        sunrise_time = pd.to_datetime(df_today['sunrise'].values[0]).strftime('%I:%M %p')
-        st.metric(label="🌅 Sunrise", value=sunrise_time)
-    
-    with col6:
-        # Convert 'sunset' to datetime and format it to 12-hour time (AM/PM)
-        sunset_time = pd.to_datetime(df_today['sunset'].values[0]).strftime('%I:%M %p')
-        st.metric(label="🌇 Sunset", value=sunset_time)
-
-    with col7:
-        # Display Lat/Long 
-        st.write("🌍 Coordinates")
-        st.write(f"**Latitude:** {ibadan_lat}")
-        st.write(f"**Longitude:** {ibadan_lon}")
-        
+# While the second date is being picked the input holds a single date
+view_range = (pd.Timestamp(date_range[0]), pd.Timestamp(date_range[-1]) + pd.Timedelta(days=1) - pd.Timedelta(1))
+
+resolution = st.sidebar.selectbox("Resolution", ['Auto'] + list(ROLLUPS))
+view_key = (view_range, resolution)
+
+
+def selected_rows(df):
+    # The selected city's rows in the date range (a slice of the sorted frame found by binary
+    # search), back in the original column types so the figures match the ones built from the
+    # CSV, and rolled up when the range is too wide to plot raw
+    rows = time_index.range(city_name, *view_range)
+    label = auto_rollup(len(rows), *view_range) if resolution == 'Auto' else resolution
+    return rollup(expand_weather_frame(rows), label)
+
+
+def section_toggle(label, key, default=False):
+    # Switch that opens a chart section; closed sections don't prepare data or build figures
+    return st.toggle(label, value=default, key=key)
+
+
+@st.fragment
+def temperature_section():
+    if not section_toggle("🌡️ Temperature trend & map", 'show_temperature', default=True):
+        return
+
+    # A station picked on the map changes the city of the whole dashboard, not just this section
+    if st.session_state.pop('station_clicked', False):
+        st.rerun()
 
     # Create a two-column layout for the 
     col1, col2 = st.columns(2)
 
 # 1. Temperature Trends over Time
     with col1:
-        # Ensure the 'forecast_time' column is in datetime format
-        df_daily['forecast_time'] = pd.to_datetime(df_daily['forecast_time'])
-
-        # Format the date to '23 Aug'
-        df_daily['date'] = df_daily['forecast_time'].dt.strftime('%d %b')
-
-        # Create an interactive Plotly line chart for temperature trends
-        fig = px.line(df_daily, x='forecast_time', y='temperature', 
-                    title='Temperature Forecasts',
-                    labels={'forecast_time': 'Time', 'temperature': 'Temperature (°C)'}, 
-                    template='plotly_white')
-
-        # Customize the layout for weather theme
-        fig.update_traces(line_color='#ff7f0e', line_width=3, mode='lines+markers',
-                        marker=dict(size=6, color='#ff7f0e', symbol='circle'))
-
-        # Customize title and axis properties
-        fig.update_layout(
-            title=dict(
-                text="Temperature Forecasts",  
-                x=0.5,  # Center the title
-                xanchor='center',  # Align it in the center
-                yanchor='top',  # Optional: Align vertically at the top
-                font=dict(size=20, color='#1f77b4', family="Arial Black")
-            ),
-            xaxis_title_font=dict(size=14, color='#4c4c4c'),
-            yaxis_title_font=dict(size=14, color='#4c4c4c'),
-            xaxis=dict(showgrid=True, gridcolor='lightgrey'),
-            yaxis=dict(showgrid=True, gridcolor='lightgrey'),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent background
-            paper_bgcolor='rgba(0,0,0,0)'  # Overall transparent background
-        )
-
-        # Show the plot in Streamlit
-        st.plotly_chart(fig, use_container_width=True)
+        with timer.span('temperature_trend'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig = cached_figure('temperature_trend', data_version, city_name,
+                                lambda: charts.temperature_trend_figure(selected_rows(df_daily)),
+                                variant=view_key)
+
+            # Show the plot in Streamlit
+            st.plotly_chart(fig, use_container_width=True)
     
-# 2. Plotly Map of Ibadan with Lat/Long
+# 2. Plotly Map of every station in view, centered on the city
     with col2:
         st.markdown(
-    """
-    <h4 style="text-align: center; color: #1f77b4;">Ibadan Map & Coordinates</h4>
+    f"""
+    <h4 style="text-align: center; color: #1f77b4;">{city_name} Map & Coordinates</h4>
     """,
     unsafe_allow_html=True
 )
-        # Get the Mapbox token from the environment
-        api_key = os.getenv("MAPBOXAPI_KEY") or st.secrets["MAPBOXAPI_KEY"]
-
-        if api_key is None:
-            st.error("Mapbox API key is not available")
-        else:
-            st.success("Mapbox API key is available")
-
-        # Create a scatter mapbox for Ibadan
-        fig = go.Figure(go.Scattermapbox(
-            lat=[ibadan_lat],
-            lon=[ibadan_lon],
-            mode='markers',
-            marker=go.scattermapbox.Marker(size=14, color='blue'),
-            text=["Ibadan"],
-        ))
-
-        # Set the mapbox style and initial zoom
-        fig.update_layout(
-            mapbox=dict(
-                style="streets",  # Change this to Mapbox-specific style like 'streets', 'satellite'
-                center=dict(lat=ibadan_lat, lon=ibadan_lon),
-                zoom=10,
-                accesstoken=api_key  # Use the Mapbox token here
-            ),
-            height=400,
-            margin={"r":0,"t":0,"l":0,"b":0}
-        )
-
-        # Show the map in Streamlit
-        st.plotly_chart(fig)
+        metric = st.radio("Color stations by", list(MAP_METRICS), horizontal=True, key='map_metric')
+        zoom = st.slider("Map zoom", 1, 12, 6, key='map_zoom')
+
+        with timer.span('location_map'):
+            # Get the Mapbox token from the environment
+            api_key = os.getenv("MAPBOXAPI_KEY") or st.secrets["MAPBOXAPI_KEY"]
+
+            if api_key is None:
+                st.error("Mapbox API key is not available")
+            else:
+                st.success("Mapbox API key is available")
+
+            # Only the stations inside the map's viewport are sent, clustered so the number of
+            # markers stays bounded however many stations there are
+            def build_map():
+                stations = station_index.current(now)
+                visible = stations.iloc[station_index.in_viewport(*viewport(city_lat, city_lon, zoom))]
+                markers = cluster_stations(visible, zoom, metric)
+                return charts.stations_map_figure(markers, city_lat, city_lon, zoom, city_name, metric, api_key)
+
+            # Build the figure, reusing the cached one while the data is unchanged
+            now = pd.Timestamp.now().floor('h')
+            fig = cached_figure('location_map', data_version, city_name, build_map, variant=(metric, zoom, now))
+
+            # Show the map in Streamlit; clicking a marker selects the nearest station
+            st.plotly_chart(fig, key='station_map', on_select=select_clicked_station, selection_mode='points')
+
+
+@st.fragment
+def humidity_section():
+    if not section_toggle("💧 Humidity & feels-like temperature", 'show_humidity'):
+        return
 
     # Create a two-column layout for the map and coordinates (if needed)
     col1, col2 = st.columns(2)
 
 # 3. Humidity vs Temperature
     with col1:
-        # Ensure the 'forecast_time' column in df_daily is in datetime format
-        df_daily['forecast_time'] = pd.to_datetime(df_daily['forecast_time'])
-
-        # Create an interactive Plotly scatter plot for Humidity vs. Temperature
-        fig = px.scatter(df_daily, x='temperature', y='humidity', 
-                        title='Humidity vs. Temperature Forecasts',
-                        labels={'temperature': 'Temperature (°C)', 'humidity': 'Humidity (%)'},
-                        template='plotly_white')
-
-        # Customize scatter points and transparency
-        fig.update_traces(marker=dict(size=12, color='#1f77b4', opacity=0.9))
-
-        # Customize title and axis properties
-        fig.update_layout(
-            title=dict(
-                text="Humidity vs. Temperature Forecasts",  # Your plot title
-                x=0.5,  # Center the title horizontally
-                xanchor='center',  # Align the title based on the center
-                yanchor='top',  # Keep the title at the top vertically
-                font=dict(size=20, color='#2ca02c', family="Arial Black")  # Fresh green title
-            ),
-            xaxis_title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis label
-            yaxis_title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for y-axis label
-            xaxis=dict(showgrid=True, gridcolor='lightgrey', gridwidth=0.5),
-            yaxis=dict(showgrid=True, gridcolor='lightgrey', gridwidth=0.5),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-            paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
-        )
-
-        # Display the plot in col1
-        st.plotly_chart(fig, use_container_width=True)
+        with timer.span('humidity_temperature'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig = cached_figure('humidity_temperature', data_version, city_name,
+                                lambda: charts.humidity_temperature_figure(selected_rows(df_daily)),
+                                variant=view_key)
+
+            # Display the plot in col1
+            st.plotly_chart(fig, use_container_width=True)
         
 # 4. Precipitation Probability
     with col2:
-        # Step 1: Create a bar chart using Plotly
-        x = df_daily['date']
-
-        # Initialize the figure
-        fig2 = go.Figure()
-
-        # Add Temperature bars (warm orange color)
-        fig2.add_trace(go.Bar(
-            x=x, 
-            y=df_daily['temperature'], 
-            name='Temperature', 
-            marker_color='#ff7f0e',
-            hoverinfo='y'
-        ))
-
-        # Add Feels Like bars (harsher red color)
-        fig2.add_trace(go.Bar(
-            x=x, 
-            y=df_daily['feels_like_temperature'], 
-            name='Feels Like', 
-            marker_color='#e63946',
-            hoverinfo='y'
-        ))
-
-        # Update layout for interactivity, theming, and readability
-        fig2.update_layout(
-            barmode='group',  # Group the bars side by side
-            title=dict(
-                text='Temperature and Feels Like Forecasts',  # Title text
-                x=0.5,  # Center the title horizontally
-                xanchor='center',  # Align the title based on the center
-                yanchor='top',  # Keep the title at the top
-                font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green for title
-            ),
-            xaxis=dict(
-                title='Date', 
-                title_font=dict(size=14, color='#ff7f0e'),  # Orange for x-axis label
-                tickformat='%d %b'  # Date format
-            ),
-            yaxis=dict(
-                title='Temperature (°C)', 
-                title_font=dict(size=14, color='#ff7f0e'),  # Orange for y-axis label
-                showgrid=True, 
-                gridcolor='lightgrey', 
-                gridwidth=0.5  # Light grey grid
-            ),
-            legend=dict(x=0.9, y=1.15, orientation="h"),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-            paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
-        )
-
-        # Add tooltips and hover features
-        fig2.update_traces(hovertemplate='%{y:.2f}°C')
-
-        # Display the plot in Streamlit
-        st.plotly_chart(fig2, use_container_width=True)
+        with timer.span('temperature_feels_like'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig2 = cached_figure('temperature_feels_like', data_version, city_name,
+                                 lambda: charts.temperature_feels_like_figure(selected_rows(df_daily)),
+                                 variant=view_key)
+
+            # Display the plot in Streamlit
+            st.plotly_chart(fig2, use_container_width=True)
+
+
+@st.fragment
+def precipitation_wind_section():
+    if not section_toggle("🌧️ Precipitation, wind & pressure", 'show_precipitation_wind'):
+        return
 
 # 5. Precipitation Probability Over Time (Col 1)
     col1, col2 = st.columns(2)
 
     with col1:
-        fig_precipitation = go.Figure()
-
-        # Plot Precipitation Probability
-        fig_precipitation.add_trace(go.Bar(
-            x=df_daily['date'],
-            y=df_daily['precipitation_probability'] * 100,
-            name='Precipitation Probability Forcasts',
-            marker_color='#1f77b4'  # Deep blue
-        ))
-
-        # Update layout for the Precipitation Probability plot
-        fig_precipitation.update_layout(
-            title=dict(
-                text='Precipitation Probability Forecasts',
-                x=0.5,  # Center the title horizontally
-                xanchor='center',  # Align the title at the center
-                yanchor='top',  # Keep the title at the top
-                font=dict(size=20, color='#1f77b4', family="Arial Black")  # Blue for title
-            ),
-            xaxis=dict(
-                title='Date', 
-                title_font=dict(size=14, color='#2ca02c'),  # Green for x-axis label
-                tickformat='%d %b'  # Format for the date
-            ),
-            yaxis=dict(
-                title='Precipitation Probability (%)',
-                title_font=dict(size=14, color='#2ca02c'),  # Green for y-axis label
-                gridcolor='lightgrey', 
-                gridwidth=0.5  # Light grey grid
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-            paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
-            showlegend=False  # Hides the legend
-        )
-
-        # Display the precipitation plot
-        st.plotly_chart(fig_precipitation, use_container_width=True)
+        with timer.span('precipitation_probability'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig_precipitation = cached_figure('precipitation_probability', data_version, city_name,
+                                              lambda: charts.precipitation_probability_figure(selected_rows(df_daily)),
+                                              variant=view_key)
+
+            # Display the precipitation plot
+            st.plotly_chart(fig_precipitation, use_container_width=True)
 
 # 6. Wind Speed and Pressure Over Time (Col 2)
     with col2:
-        fig_wind_pressure = go.Figure()
-
-        # Add Wind Speed bars
-        fig_wind_pressure.add_trace(go.Bar(
-            x=df_daily['date'],
-            y=df_daily['wind_speed'],
-            name='Wind Speed',
-            marker_color='#bcbd22'  # Earthy brown
-        ))
-
-        # Add Pressure line
-        fig_wind_pressure.add_trace(go.Scatter(
-            x=df_daily['date'],
-            y=df_daily['pressure'],
-            mode='lines',
-            name='Pressure',
-            line=dict(color='#1f77b4', width=2)  
-        ))
-
-        # Update layout for the Wind Speed and Pressure plot
-        fig_wind_pressure.update_layout(
-            title=dict(
-                text='Wind Speed and Pressure Forecasts',
-                x=0.5,  # Center the title horizontally
-                xanchor='center',  # Align the title at the center
-                yanchor='top',  # Keep the title at the top
-                font=dict(size=20, color='#1f77b4', family="Arial Black")  # Blue for title
-            ),
-            xaxis=dict(
-                title='Date', 
-                title_font=dict(size=14, color='#2ca02c'),  # Green for x-axis label
-                tickformat='%d %b'
-            ),
-            yaxis=dict(
-                title='Wind Speed (m/s)',
-                title_font=dict(size=14, color='#2ca02c'),  # Green for y-axis label
-                gridcolor='lightgrey', 
-                gridwidth=0.4
-            ),
-            yaxis2=dict(
-                title='Pressure (hPa)', 
-                overlaying='y', 
-                side='right', 
-                showgrid=False, 
-                tickfont=dict(color='#7f7f7f')  # Grey for the secondary axis
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-            paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
-            showlegend=True  # Display the legend
-        )
-
-        # Display the Wind Speed and Pressure plot
-        st.plotly_chart(fig_wind_pressure, use_container_width=True)
+        with timer.span('wind_pressure'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig_wind_pressure = cached_figure('wind_pressure', data_version, city_name,
+                                              lambda: charts.wind_pressure_figure(selected_rows(df_daily)),
+                                              variant=view_key)
+
+            # Display the Wind Speed and Pressure plot
+            st.plotly_chart(fig_wind_pressure, use_container_width=True)
+
+
+@st.fragment
+def range_section():
+    if not section_toggle("📈 Temperature range & humidity over time", 'show_ranges'):
+        return
 
     # Create two columns
     col1, col2 = st.columns(2)
 
 # 7. Temperature Range Plot as an Area Chart
     with col1:
-        # Create an area chart for temperature range
-        fig_temp_range = go.Figure()
-
-        # Max temperature (area fill)
-        fig_temp_range.add_trace(go.Scatter(
-            x=df_daily['date'],
-            y=df_daily['max_temperature'],
-            name='Max Temp',
-            fill='tonexty',
-            mode='none',  # No line, just filled area
-            fillcolor='rgba(255, 69, 0, 0.6)',  # Red-orange fill
-        ))
-
-        # Min temperature (area fill)
-        fig_temp_range.add_trace(go.Scatter(
-            x=df_daily['date'],
-            y=df_daily['min_temperature'],
-            name='Min Temp',
-            fill='tozeroy',
-            mode='none',
-            fillcolor='rgba(30, 144, 255, 0.6)',  # Cool blue fill
-        ))
-
-        # Update layout for temperature plot
-        fig_temp_range.update_layout(
-            title=dict(
-                text='Today & 5-Day Temperature Forecast',
-                x=0.5,  # Center the title
-                xanchor='center',  # Align title center
-                yanchor='top',  # Keep the title at the top
-                font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green title
-            ),
-            xaxis=dict(
-                title='Date',
-                title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis
-                tickformat='%d %b'  # Format date as "23 Aug"
-            ),
-            yaxis=dict(
-                title='Temperature (°C)',
-                title_font=dict(size=14, color='#ff7f0e')  # Warm orange for y-axis
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent background
-            paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
-            showlegend=True,  # Show legend
-            legend=dict(
-                orientation="h", 
-                yanchor="bottom", 
-                y=1.02, 
-                xanchor="right", 
-                x=1
-            )  # Horizontal legend at the top
-        )
-
-        # Display the area plot in col1
-        st.plotly_chart(fig_temp_range, use_container_width=True)
+        with timer.span('temperature_range'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig_temp_range = cached_figure('temperature_range', data_version, city_name,
+                                           lambda: charts.temperature_range_figure(selected_rows(df_daily)),
+                                           variant=view_key)
+
+            # Display the area plot in col1
+            st.plotly_chart(fig_temp_range, use_container_width=True)
 
 # 8. Humidity Over Time as an Area Chart
     with col2:
-        # Create an area chart for humidity
-        fig_humidity = go.Figure()
-
-        # Plot Humidity with fill
-        fig_humidity.add_trace(go.Scatter(
-            x=df_daily['date'],
-            y=df_daily['humidity'],
-            name='Humidity',
-            fill='tozeroy',
-            mode='none',
-            fillcolor='rgba(225, 69, 0, 0.6)',  
-        ))
-
-        # Update layout for humidity plot
-        fig_humidity.update_layout(
-            title=dict(
-                text='Today & A 5-Day Humidity Forecast',
-                x=0.5,  # Center the title
-                xanchor='center',  # Align title center
-                yanchor='top',  # Keep the title at the top
-                font=dict(size=20, color='#2ca02c', family="Arial Black")  # Green title
-            ),
-            xaxis=dict(
-                title='Date',
-                title_font=dict(size=14, color='#ff7f0e'),  # Warm orange for x-axis title
-                tickformat='%d %b'  # Format date as "23 Aug"
-            ),
-            yaxis=dict(
-                title='Humidity (%)',
-                title_font=dict(size=14, color='#ff7f0e')  # Warm orange for y-axis title
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-            paper_bgcolor='rgba(0,0,0,0)',  # Transparent paper background
-            showlegend=True,  # Enable the legend
-            legend=dict(
-                orientation="h", 
-                yanchor="bottom", 
-                y=1.02, 
-                xanchor="right", 
-                x=1
-            )  # Horizontal legend at the top
-        )
-
-        # Display the area plot in col2
-        st.plotly_chart(fig_humidity, use_container_width=True)
-
-# Step 1: Calculate the correlation matrix for the weather data
-    corr_matrix = df_daily[['temperature', 'feels_like_temperature', 'humidity', 'cloudiness', 'precipitation_probability', 'wind_speed', 'pressure']].corr()
-
-    # Step 2: Convert correlation matrix to a 2D array for plotting
-    z = corr_matrix.values
-    x_labels = corr_matrix.columns.tolist()
-    y_labels = corr_matrix.columns.tolist()
-
-    # Step 3: Create the heatmap using Plotly
-    fig_heatmap = ff.create_annotated_heatmap(
-        z, 
-        x=x_labels, 
-        y=y_labels, 
-        colorscale='RdBu',  # Red-Blue color scheme for weather
-        reversescale=True,  # To match the coolwarm theme
-        annotation_text=np.round(z, decimals=2),  # Display correlation values
-        showscale=True  # Color bar scale
-    )
-
-    # Step 4: Update the layout for the heatmap
-    fig_heatmap.update_layout(
-        title=dict(
-            text='Correlation Heatmap of Weather Variables',
-            x=0.5,  # Center the title horizontally
-            xanchor='center',  # Anchor the title to the center
-            yanchor='top',  # Keep the title at the top
-            font=dict(size=20, color='#FF8C00', family="Arial Black")  # Warm orange for the title
-        ),
-        xaxis_nticks=len(x_labels),  # Ensure we have labels for all columns
-        yaxis_nticks=len(y_labels),
-        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot background
-        paper_bgcolor='rgba(0,0,0,0)'  # Transparent paper background
-    )
-
-    # Display the Plotly heatmap in Streamlit
-    st.plotly_chart(fig_heatmap, use_container_width=True)
+        with timer.span('humidity_area'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig_humidity = cached_figure('humidity_area', data_version, city_name,
+                                         lambda: charts.humidity_area_figure(selected_rows(df_daily)),
+                                         variant=view_key)
+
+            # Display the area plot in col2
+            st.plotly_chart(fig_humidity, use_container_width=True)
+
+
+@st.fragment
+def derived_metrics_section():
+    if not section_toggle("🌫️ Heat index, dew point & daily rollups", 'show_derived_metrics'):
+        return
+
+    # Create two columns
+    col1, col2 = st.columns(2)
+
+# 9. Heat Index and Dew Point over time (derived columns, computed once per data version)
+    with col1:
+        with timer.span('comfort'):
+            # Build the figure, reusing the cached one while the data is unchanged
+            fig_comfort = cached_figure('comfort', data_version, city_name,
+                                        lambda: charts.comfort_figure(selected_rows(df_daily)),
+                                        variant=view_key)
+
+            # Display the comfort plot in col1
+            st.plotly_chart(fig_comfort, use_container_width=True)
+
+# 10. Diurnal range, rain totals and dominant wind per day, straight from the daily summary
+    with col2:
+        with timer.span('daily_rollups'):
+            fig_daily = cached_figure('daily_rollups', data_version, city_name,
+                                      lambda: charts.daily_rollups_figure(
+                                          city_daily_summary(daily_summary, city_name, *view_range)),
+                                      variant=view_key)
+
+            # Display the daily rollups plot in col2
+            st.plotly_chart(fig_daily, use_container_width=True)
+
+
+@st.fragment
+def heatmap_section():
+    if not section_toggle("🔥 Correlation heatmap", 'show_heatmap'):
+        return
+
+# Correlation Heatmap of the weather variables over the forecast days in the date range,
+# merged from the stored per-day moment states instead of a pass over every row
+    with timer.span('correlation_heatmap'):
+        fig_heatmap = cached_figure('correlation_heatmap', data_version, city_name,
+                                    lambda: charts.correlation_heatmap_figure(
+                                        correlation_matrix(correlation_states, city=city_name, start=view_range[0], end=view_range[1])),
+                                    variant=view_key)
+
+        # Display the Plotly heatmap in Streamlit
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+
+
+
+# If there's no data for today, display a message
+if today_summary is None:
+    st.error("No weather data available for today.")
+else:
+    st.markdown(
+    f"""
+    <h3 style="color: #2ca02c;">Weather Overview for {formatted_today}</h3>
+    """, 
+    unsafe_allow_html=True
+)
+    #st.write(f"### Weather Overview for {formatted_today}")
+    
+    # Set up a four-column layout for today's key weather metrics
+    with timer.span('tiles'):
+        col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
+    
+        with col1:
+            max_temp = today_summary['max_temperature']
+            st.metric(label="🌡️ Max Temperature", value=f"{max_temp:.2f}°C")
+    
+        with col2:
+            min_temp = today_summary['min_temperature']
+            st.metric(label="🌡️ Min Temperature", value=f"{min_temp:.2f}°C")
+    
+        with col3:
+            total_precip = today_summary['total_precipitation']
+            st.metric(label="🌧️ Total Precipitation", value=f"{total_precip:.2f} mm")
+    
+        with col4:
+            max_wind = today_summary['max_wind_speed']
+            st.metric(label="🌬️ Max Wind Speed", value=f"{max_wind:.2f} m/s")
+    
+        with col5:
+            # 'sunrise' is already formatted to 12-hour time (AM/PM) in the summary
+            sunrise_time = today_summary['sunrise_time']
+            st.metric(label="🌅 Sunrise", value=sunrise_time)
+    
+        with col6:
+            # 'sunset' is already formatted to 12-hour time (AM/PM) in the summary
+            sunset_time = today_summary['sunset_time']
+            st.metric(label="🌇 Sunset", value=sunset_time)
+
+        with col7:
+            # Display Lat/Long 
+            st.write("🌍 Coordinates")
+            st.write(f"**Latitude:** {city_lat}")
+            st.write(f"**Longitude:** {city_lon}")
+        
+
+    # Chart sections: each one is computed only once it is switched on, and its switch
+    # reruns just that section instead of the whole dashboard
+    temperature_section()
+    humidity_section()
+    precipitation_wind_section()
+    range_section()
+    derived_metrics_section()
+    heatmap_section()
 
 # Footer in Streamlit using st.markdown with enhanced styling
 footer = """
@@ -541,4 +437,17 @@ footer = """
     """
 
 # Display the footer using markdown
-st.markdown(footer, unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(footer, unsafe_allow_html=True)
+
+# Close this rerun's timings (exported to Prometheus when WEATHER_METRICS is set)
+sections = timer.finish()
+
+# Debug panel: where this rerun spent its time
+if DEBUG_PANEL_ENABLED:
+    with st.sidebar.expander("⏱️ Rerun timings", expanded=False):
+        st.write(f"**Total:** {timer.total * 1000:.1f} ms")
+        st.dataframe(
+            pd.DataFrame({'section': list(sections), 'ms': [seconds * 1000 for seconds in sections.values()]}),
+            hide_index=True,
+            use_container_width=True,
+        )
\ No newline at end of file
@@ -0,0 +1,353 @@
+# weather_store.py
+import os
+import shutil
+import sys
+import threading
+import uuid
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from correlation import rebuild_correlation_states, states_path, update_correlation_states
+from daily_summary import rebuild_daily_summary, summary_path, update_daily_summary
+from data_loader import DATA_PATH, DATE_COLUMNS, DATE_FORMAT, VERSION_FILE, WEATHER_DTYPES, read_weather_csv
+
+# Default location of the columnar weather store
+STORE_PATH = 'weather_store'
+
+# Column order of the transformed weather data (same as df_flat in main.ipynb)
+WEATHER_COLUMNS = [
+    'forecast_time', 'temperature', 'feels_like_temperature', 'min_temperature', 'max_temperature',
+    'pressure', 'humidity', 'cloudiness', 'wind_speed', 'wind_direction', 'visibility',
+    'precipitation_probability', 'rain_volume', 'weather_main', 'weather_description',
+    'city_name', 'country', 'city_latitude', 'city_longitude', 'population', 'timezone',
+    'sunrise', 'sunset',
+]
+
+# A forecast row is identified by its city and forecast time; each ingest run also
+# records when the forecast was issued, so older versions of a row can be compared
+KEY_COLUMNS = ['city_name', 'forecast_time']
+VALUE_COLUMNS = [column for column in WEATHER_COLUMNS if column not in KEY_COLUMNS]
+STORE_COLUMNS = WEATHER_COLUMNS + ['issued_at']
+
+# Arrow types for each column, with real timestamps for forecast_time/sunrise/sunset
+_ARROW_TYPES = {'float64': pa.float64(), 'int64': pa.int64(), 'object': pa.string()}
+WEATHER_SCHEMA = pa.schema(
+    [(name, pa.timestamp('s')) if name in DATE_COLUMNS else (name, _ARROW_TYPES[WEATHER_DTYPES[name]])
+     for name in WEATHER_COLUMNS]
+)
+
+# One directory per city and forecast date: weather_store/city_name=Ibadan/forecast_date=2024-09-15/
+PARTITION_SCHEMA = pa.schema([('city_name', pa.string()), ('forecast_date', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+# A multi-city batch covers (cities x forecast days) partitions; pyarrow's default cap is 1024
+MAX_PARTITIONS = 1_000_000
+
+# Full schema of the stored rows (stores written before issued_at existed read it back as null).
+# issued_at is kept to the microsecond, so two writes in the same second stay two versions;
+# files written with second resolution are read back cast to it.
+STORE_SCHEMA = WEATHER_SCHEMA.append(pa.field('issued_at', pa.timestamp('us'))) \
+    .append(pa.field('forecast_date', pa.string()))
+
+# Columns inside each Parquet file (the partition columns live in the directory names)
+FILE_SCHEMA = pa.schema([field for field in STORE_SCHEMA if field.name not in PARTITION_SCHEMA.names])
+
+
+# Last issue time handed out by this process
+_last_issue = pd.Timestamp.min
+_issue_lock = threading.Lock()
+
+
+def issue_time():
+    # Issue time recorded for a batch: now, in UTC, to the microsecond. Strictly increasing
+    # within a process, so back-to-back writes never share an issue time even if the clock
+    # hasn't moved (or stepped back).
+    global _last_issue
+    with _issue_lock:
+        now = pd.Timestamp.now(tz='UTC').tz_localize(None).floor('us')
+        _last_issue = max(now, _last_issue + pd.Timedelta(microseconds=1))
+        return _last_issue
+
+
+def to_weather_table(df, issued_at=None):
+    # Coerce a flattened forecast frame (pandas, or a Spark frame's toPandas()) to the store schema
+    df = df[WEATHER_COLUMNS].copy()
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    df = df.astype(WEATHER_DTYPES)
+    if issued_at is None:
+        df['issued_at'] = issue_time()
+    elif pd.api.types.is_list_like(issued_at):
+        # One issue time per row (e.g. rows of several archived responses)
+        df['issued_at'] = pd.DatetimeIndex(issued_at).floor('us')
+    else:
+        df['issued_at'] = pd.Timestamp(issued_at).floor('us')
+
+    # Partition key: the calendar date of each forecast
+    df['forecast_date'] = df['forecast_time'].dt.strftime('%Y-%m-%d')
+
+    return pa.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False)
+
+
+def unique_rows(table):
+    # A batch can carry the same (city, forecast_time) more than once, e.g. when two
+    # locations resolve to the same OpenWeatherMap city; the last one in the batch wins.
+    # Returns the table and its pandas frame, both without the duplicates.
+    df = table.to_pandas()
+    keep = ~df.duplicated(KEY_COLUMNS, keep='last').to_numpy()
+    if keep.all():
+        return table, df
+    return table.filter(pa.array(keep)), df[keep].reset_index(drop=True)
+
+
+def publish_store_version(root):
+    # Swap the version pointer readers go by; written last, once every file of the new
+    # version is in place, so the dashboard only ever switches to a complete version
+    version = f"{issue_time():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(root, VERSION_FILE)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(version)
+    os.replace(temp_path, path)
+    return version
+
+
+def write_staged(table, root, replace=False):
+    # Write the table's partitions to a hidden staging directory, then move them into the store
+    staging = os.path.join(root, f'.staging-{uuid.uuid4().hex}')
+    ds.write_dataset(
+        table,
+        staging,
+        format='parquet',
+        partitioning=PARTITIONING,
+        max_partitions=MAX_PARTITIONS,
+        basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+    )
+    return move_staged(staging, root, replace)
+
+
+def move_staged(staging, root, replace=False):
+    # Move each finished file of a hive-partitioned staging directory (written by pyarrow or
+    # by the Spark job) into its partition with an atomic rename, so readers never see a
+    # half-written file. With replace=True a partition's earlier files are removed once the
+    # new ones are in place, so a partition is never empty in between.
+    # Returns the (city, forecast_date) partitions written.
+    partitions = []
+    try:
+        for city_folder in _subdirectories(staging, 'city_name='):
+            # Spark and pyarrow escape city names differently; re-encode them the store's way
+            city = unquote(os.path.basename(city_folder).split('=', 1)[1])
+            for date_folder in _subdirectories(city_folder, 'forecast_date='):
+                files = _data_files(date_folder)
+                if not files:
+                    continue
+                date = os.path.basename(date_folder).split('=', 1)[1]
+                target = partition_path(root, city, date)
+                os.makedirs(target, exist_ok=True)
+                old_files = _data_files(target) if replace else []
+                for file in files:
+                    os.replace(file, os.path.join(target, os.path.basename(file)))
+                for file in old_files:
+                    os.remove(file)
+                partitions.append((city, date))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return partitions
+
+
+def write_weather_store(df, root=STORE_PATH, issued_at=None):
+    # Write the frame as Parquet, replacing only the city/date partitions it covers
+    table, batch = unique_rows(to_weather_table(df, issued_at))
+    write_staged(table, root, replace=True)
+    update_derived_tables(root, batch)
+    publish_store_version(root)
+
+
+def partition_path(root, city, date):
+    # Directory of one partition, with the city name encoded the way pyarrow writes it
+    return os.path.join(root, f'city_name={quote(city, safe="")}', f'forecast_date={date}')
+
+
+def _subdirectories(folder, prefix):
+    if not os.path.isdir(folder):
+        return []
+    return [entry.path for entry in os.scandir(folder) if entry.is_dir() and entry.name.startswith(prefix)]
+
+
+def _data_files(folder):
+    # Parquet files of one partition, skipping hidden/temporary files the way pyarrow does
+    if not os.path.isdir(folder):
+        return []
+    return [entry.path for entry in os.scandir(folder)
+            if entry.name.endswith('.parquet') and not entry.name.startswith(('.', '_'))]
+
+
+def partition_files(root=STORE_PATH, city=None, date=None):
+    # Files of the partitions matching city/date, found from the directory names alone,
+    # so only the matching directories are ever listed
+    if city is not None:
+        city_folders = [os.path.join(root, f'city_name={quote(city, safe="")}')]
+    else:
+        city_folders = _subdirectories(root, 'city_name=')
+
+    files = []
+    for city_folder in city_folders:
+        if date is not None:
+            date_folders = [os.path.join(city_folder, f'forecast_date={date}')]
+        else:
+            date_folders = _subdirectories(city_folder, 'forecast_date=')
+        for date_folder in date_folders:
+            files.extend(_data_files(date_folder))
+    return files
+
+
+def open_weather_store(root=STORE_PATH, files=None):
+    # The store (or just the given files of it) as one pyarrow dataset
+    if files is None:
+        files = partition_files(root)
+    return ds.dataset(files, schema=STORE_SCHEMA, format='parquet', partitioning=PARTITIONING,
+                      partition_base_dir=root)
+
+
+def read_partitions(root, partitions):
+    # Every stored version in the given (city, forecast_date) partitions. Only those
+    # directories are opened, so the rest of the store is never listed.
+    files = []
+    for city, date in partitions:
+        files.extend(_data_files(partition_path(root, city, date)))
+    return open_weather_store(root, files).to_table(columns=STORE_COLUMNS).to_pandas()
+
+
+def latest_rows(df):
+    # Keep the most recently issued version of each (city, forecast_time). Versions issued
+    # at the same instant (only possible from separate processes, or in stores written
+    # before issue times had microseconds) are ordered by their values, so every reader,
+    # and the derived tables, pick the same one rather than whichever file was listed last.
+    order = ['issued_at']
+    if df.duplicated(KEY_COLUMNS + ['issued_at']).any():
+        order += [column for column in VALUE_COLUMNS if column in df]
+    df = df.sort_values(order, kind='stable', na_position='first')
+    return df.drop_duplicates(KEY_COLUMNS, keep='last')
+
+
+def read_weather_store(root=STORE_PATH, city=None, date=None, columns=None, history=False):
+    # Read the store into pandas, pushing the city/date filters down to the partition
+    # directories and only decoding the requested columns.
+    # By default only the latest version of each forecast row is returned; history=True
+    # returns every issued version (including issued_at) for drift analysis.
+    if date is not None:
+        date = pd.Timestamp(date).strftime('%Y-%m-%d')
+    dataset = open_weather_store(root, partition_files(root, city, date))
+
+    if columns is None:
+        columns = STORE_COLUMNS if history else WEATHER_COLUMNS
+    read_columns = list(dict.fromkeys([*columns, *KEY_COLUMNS, 'issued_at']))
+
+    df = dataset.to_table(columns=read_columns).to_pandas()
+    if history:
+        # A compaction in progress can briefly expose the same version twice (identical rows;
+        # versions that differ in their values are all kept, even under one issue time)
+        df = df.drop_duplicates()
+    else:
+        df = latest_rows(df)
+
+    df = df.sort_values(['forecast_time', 'city_name'], ignore_index=True)
+    return df[list(columns)]
+
+
+def update_derived_tables(root, df):
+    # Refresh the daily summary and correlation states of the partitions df was written to.
+    # The touched partitions are read once and shared by both tables.
+    if not (os.path.isdir(summary_path(root)) and os.path.isdir(states_path(root))):
+        # A new store, or one from before the per-date layout: build both tables from the
+        # whole store, read once
+        full = read_weather_store(root)
+        rebuild_daily_summary(root, full)
+        rebuild_correlation_states(root, full)
+        return
+    partitions = df[['city_name', 'forecast_date']].drop_duplicates().itertuples(index=False, name=None)
+    latest = latest_rows(read_partitions(root, partitions))
+    update_daily_summary(root, latest)
+    update_correlation_states(root, latest)
+
+
+def append_weather_store(df, root=STORE_PATH, issued_at=None):
+    # Incremental ingest: write only the rows that are new or whose values changed since
+    # the last stored version. Only the partitions the batch touches are read, so the
+    # cost follows the batch size rather than the size of the history.
+    table, batch = unique_rows(to_weather_table(df, issued_at))
+
+    partitions = batch[['city_name', 'forecast_date']].drop_duplicates().itertuples(index=False, name=None)
+    stored = read_partitions(root, partitions)
+
+    # Each row is compared with the latest version issued no later than itself: for a fresh
+    # fetch that is the latest stored one, while a backfilled older response is compared with
+    # what was current at its issue time (so ingesting an archive twice adds nothing)
+    stored = stored.merge(batch[KEY_COLUMNS + ['issued_at']], on=KEY_COLUMNS, suffixes=('', '_batch'))
+    stored = latest_rows(stored[~(stored['issued_at'] > stored['issued_at_batch'])])
+
+    merged = batch.merge(stored[WEATHER_COLUMNS], on=KEY_COLUMNS, how='left',
+                         suffixes=('', '_stored'), indicator=True)
+    changed = (merged['_merge'] == 'left_only').to_numpy()
+    for column in VALUE_COLUMNS:
+        new, old = merged[column], merged[column + '_stored']
+        changed |= ~((new == old) | (new.isna() & old.isna())).to_numpy()
+
+    new_rows = table.filter(pa.array(changed))
+    if new_rows.num_rows:
+        # Unique file names, so each run adds files next to the earlier ones
+        write_staged(new_rows, root)
+        update_derived_tables(root, batch[changed])
+        publish_store_version(root)
+    return new_rows.num_rows
+
+
+def compact_weather_store(root=STORE_PATH, min_files=2):
+    # Merge each partition's small per-run files into one file, keeping every version.
+    # Returns the number of partitions rewritten.
+    compacted = 0
+    folders = [folder for city_folder in _subdirectories(root, 'city_name=')
+               for folder in _subdirectories(city_folder, 'forecast_date=')]
+    for folder in folders:
+        files = sorted(_data_files(folder))
+        if len(files) < min_files:
+            continue
+
+        merged = pa.concat_tables(
+            [pq.read_table(file, schema=FILE_SCHEMA) for file in files]
+        ).sort_by([('forecast_time', 'ascending'), ('issued_at', 'ascending')])
+
+        # Write the merged file before removing its inputs, so no rows go missing
+        temp_path = os.path.join(folder, f'.compact-{uuid.uuid4().hex}.parquet.tmp')
+        pq.write_table(merged, temp_path)
+        os.replace(temp_path, os.path.join(folder, f'part-compacted-{uuid.uuid4().hex}.parquet'))
+        for file in files:
+            os.remove(file)
+        compacted += 1
+    return compacted
+
+
+def export_csv(root=STORE_PATH, csv_path=DATA_PATH):
+    # Write the latest version of every row back out as the flat CSV the notebook used to produce.
+    # The CSV is written next to the target and renamed over it, so readers never see half of it.
+    df = read_weather_store(root)
+    temp_path = f'{csv_path}.{uuid.uuid4().hex}.tmp'
+    df.to_csv(temp_path, index=False, date_format=DATE_FORMAT)
+    os.replace(temp_path, csv_path)
+
+
+if __name__ == '__main__':
+    # Build the store from the existing CSV: python weather_store.py [csv_path] [store_path]
+    # Merge small files in an existing store:  python weather_store.py --compact [store_path]
+    if len(sys.argv) > 1 and sys.argv[1] == '--compact':
+        store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_PATH
+        print(f'Compacted {compact_weather_store(store_path)} partitions in {store_path}')
+    else:
+        csv_path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+        store_path = sys.argv[2] if len(sys.argv) > 2 else STORE_PATH
+        write_weather_store(read_weather_csv(csv_path), store_path)
+        print(f'Wrote {csv_path} to {store_path}')